@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.engine.url import make_url
 from dotenv import load_dotenv
@@ -22,6 +22,19 @@ engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
 )
+
+if engine.dialect.name == "sqlite":
+    # Receta de SQLAlchemy para SAVEPOINT con pysqlite: el driver no emite BEGIN
+    # antes del primer SAVEPOINT, y su RELEASE confirmaría como un COMMIT.
+    # Desactivamos su manejo de transacciones y emitimos BEGIN nosotros.
+    @event.listens_for(engine, "connect")
+    def _sqlite_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _sqlite_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 def get_db():
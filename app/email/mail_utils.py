@@ -17,6 +17,10 @@ IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 
+# TLS activado por defecto; solo se desactiva para servidores locales (ej: benchmarks)
+IMAP_SSL = os.getenv("IMAP_SSL", "true").lower() == "true"
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS", "")
 EMAIL_APP_PASSWORD = os.getenv("EMAIL_APP_PASSWORD", "")
 
@@ -50,20 +54,23 @@ def html_to_text(html: str) -> str:
 # =========================
 def connect_imap():
     """
-    Conecta a IMAP, hace login y selecciona INBOX. Retorna el cliente imaplib.IMAP4_SSL.
+    Conecta a IMAP, hace login y selecciona INBOX. Retorna el cliente imaplib.IMAP4_SSL
+    (o imaplib.IMAP4 si IMAP_SSL=false).
     """
     if not EMAIL_ADDRESS or not EMAIL_APP_PASSWORD:
         raise RuntimeError("Faltan EMAIL_ADDRESS o EMAIL_APP_PASSWORD para IMAP")
 
-    client = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
+    imap_cls = imaplib.IMAP4_SSL if IMAP_SSL else imaplib.IMAP4
+    client = imap_cls(IMAP_HOST, IMAP_PORT)
     client.login(EMAIL_ADDRESS, EMAIL_APP_PASSWORD)
     client.select("INBOX")  # INBOX por defecto
     return client
 
 
-def fetch_unseen(client):
+def fetch_unseen(client, skip_uids=None):
     """
     Itera sobre correos NO LEÍDOS (UNSEEN) en INBOX.
+    skip_uids: UIDs que ya tenemos en memoria (no se vuelven a bajar).
     Yields: (uid:int, msg:email.message.Message)
     """
     typ, data = client.uid("search", None, "UNSEEN")
@@ -71,7 +78,10 @@ def fetch_unseen(client):
         return
 
     uids = data[0].split() if data and data[0] else []
+    skip = skip_uids or set()
     for uid in uids:
+        if int(uid) in skip:
+            continue
         typ, msg_data = client.uid("fetch", uid, "(RFC822)")
         if typ != "OK" or not msg_data or not msg_data[0]:
             continue
@@ -118,11 +128,11 @@ def send_mail(to_addr: str, subject: str, body: str) -> dict:
 
     recipients = [to_addr] + ([CC_ME] if CC_ME else [])
 
-    context = ssl.create_default_context()
     with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as server:
         server.ehlo()
-        server.starttls(context=context)
-        server.ehlo()
+        if SMTP_STARTTLS:
+            server.starttls(context=ssl.create_default_context())
+            server.ehlo()
         server.login(EMAIL_ADDRESS, EMAIL_APP_PASSWORD)
 
         result = server.sendmail(EMAIL_ADDRESS, recipients, msg.as_string())
@@ -0,0 +1,254 @@
+# app/email/scheduler.py
+"""
+Planificador entre la lectura IMAP y el procesamiento de correos.
+
+- Token bucket por remitente: como máximo SENDER_RATE_PER_MIN correos/min
+  (con ráfagas de hasta SENDER_BURST). Lo que exceda queda en espera (sigue
+  UNSEEN en el buzón). Pasado SENDER_MAX_QUEUE el resto ni se guarda en
+  memoria: se aplaza por UID y se vuelve a bajar cuando la cola tiene sitio.
+  Nunca se descarta un correo.
+- Round-robin entre remitentes: un remitente que inunda el buzón no retrasa
+  al resto.
+- Prioridad: los pedidos que se resuelven con reglas (ej: lista) van antes que
+  los que necesitan LLM.
+"""
+import bisect
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+# --- Config desde .env (0 = sin límite) ---
+SENDER_RATE_PER_MIN = float(os.getenv("SENDER_RATE_PER_MIN", "10"))
+SENDER_BURST = int(os.getenv("SENDER_BURST", "5"))
+SENDER_MAX_QUEUE = int(os.getenv("SENDER_MAX_QUEUE", "20"))
+RATE_LIMIT_EXEMPT = {s.strip().lower() for s in os.getenv("RATE_LIMIT_EXEMPT", "").split(",") if s.strip()}
+# false = orden de UID (FIFO) como antes; los límites por remitente siguen aplicando
+FAIR_SCHEDULING = os.getenv("FAIR_SCHEDULING", "true").lower() == "true"
+# Intentos de aviso por episodio (ej: dirección falsa que rebota con 550)
+NOTICE_MAX_ATTEMPTS = 3
+
+
+class TokenBucket:
+    def __init__(self, rate_per_min: float, burst: int, now: float):
+        self.rate = rate_per_min / 60.0
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def available(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class Throttled:
+    """Resumen por remitente limitado en este ciclo (para una sola respuesta)."""
+    sender: str
+    pending: int
+    notify: bool = False
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        *,
+        rate_per_min: float = SENDER_RATE_PER_MIN,
+        burst: int = SENDER_BURST,
+        max_queue: int = SENDER_MAX_QUEUE,
+        exempt: Optional[Set[str]] = None,
+        fair: bool = FAIR_SCHEDULING,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate_per_min = rate_per_min
+        self.burst = burst
+        self.max_queue = max_queue
+        self.exempt = RATE_LIMIT_EXEMPT if exempt is None else exempt
+        self.fair = fair
+        self.clock = clock
+
+        # Dos niveles (reglas / LLM), cada uno con una cola por remitente.
+        # El orden del OrderedDict es el turno del round-robin.
+        self._tiers: Tuple[OrderedDict, OrderedDict] = (OrderedDict(), OrderedDict())
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._queued: Set[int] = set()
+        # UIDs que ya pagaron token: si vuelven (sin marcar leído) no pagan otra vez
+        self._charged: Set[int] = set()
+        # Pasado max_queue: solo el UID (ordenado), el correo sigue UNSEEN en el buzón
+        self._deferred: Dict[str, List[int]] = {}
+        self._waiting: Set[str] = set()
+        self._notified: Set[str] = set()
+        self._notice_attempts: Dict[str, int] = {}
+
+    # --- estado ---
+    def _limited(self, sender: str) -> bool:
+        return self.rate_per_min > 0 and sender not in self.exempt
+
+    def _queue_len(self, sender: str) -> int:
+        return sum(len(tier.get(sender, ())) for tier in self._tiers)
+
+    def _pending(self, sender: str) -> int:
+        return self._queue_len(sender) + len(self._deferred.get(sender, ()))
+
+    def pending_uids(self) -> Set[int]:
+        """UIDs en cola o aplazados: no hace falta volver a bajarlos del buzón."""
+        deferred = {uid for uids in self._deferred.values() for uid in uids}
+        return self._queued | deferred
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    # --- entrada ---
+    def add(self, uid: int, msg, *, sender: str, cheap: bool) -> None:
+        if uid in self._queued:
+            return
+        if self._limited(sender) and self.max_queue > 0:
+            deferred = self._deferred.get(sender, [])
+            # Con aplazados más antiguos, lo nuevo va detrás de ellos (orden de UID)
+            if self._queue_len(sender) >= self.max_queue or (deferred and uid > deferred[0]):
+                if uid not in deferred:
+                    bisect.insort(self._deferred.setdefault(sender, deferred), uid)
+                return
+        tier = self._tiers[0 if cheap else 1]
+        tier.setdefault(sender, deque()).append((uid, msg))
+        self._queued.add(uid)
+
+    def done(self, uid: int) -> None:
+        """El correo quedó marcado leído: ya no volverá a entrar."""
+        self._charged.discard(uid)
+
+    # --- salida ---
+    def _take_token(self, sender: str, uid: int, now: float) -> bool:
+        if not self._limited(sender) or uid in self._charged:
+            return True
+        bucket = self._buckets.get(sender)
+        if bucket is None:
+            bucket = self._buckets[sender] = TokenBucket(self.rate_per_min, self.burst, now)
+        if bucket.try_take(now):
+            self._charged.add(uid)
+            return True
+        self._waiting.add(sender)
+        return False
+
+    def _pop(self, tier: OrderedDict, sender: str):
+        queue: Deque = tier[sender]
+        uid, msg = queue.popleft()
+        if queue:
+            tier.move_to_end(sender)  # siguiente turno para otro remitente
+        else:
+            del tier[sender]
+        self._queued.discard(uid)
+        return uid, msg
+
+    def _next(self, served: Set[str]):
+        now = self.clock()
+        if self.fair:
+            for tier in self._tiers:
+                for sender in list(tier):
+                    if sender in served:
+                        continue
+                    if self._take_token(sender, tier[sender][0][0], now):
+                        return sender, self._pop(tier, sender)
+            return None
+
+        # FIFO: el UID más antiguo entre las cabezas de cada cola
+        heads = sorted(
+            (queue[0][0], i, sender)
+            for i, tier in enumerate(self._tiers)
+            for sender, queue in tier.items()
+        )
+        for uid, i, sender in heads:
+            if self._take_token(sender, uid, now):
+                return sender, self._pop(self._tiers[i], sender)
+        return None
+
+    def ready(self) -> Iterator[Tuple[int, object]]:
+        """
+        Una vuelta del round-robin: como máximo un correo por remitente (reglas
+        antes que LLM). Así el worker vuelve a leer el buzón entre vueltas y lo
+        que llega detrás de una inundación no espera a que esta se procese.
+        En modo FIFO entrega todo lo que tenga token, en orden de UID.
+        Lo que quede sin token espera al siguiente ciclo.
+        """
+        served: Set[str] = set()
+        while True:
+            item = self._next(served)
+            if item is None:
+                return
+            sender, (uid, msg) = item
+            if self.fair:
+                served.add(sender)
+            yield uid, msg
+
+    def has_ready(self) -> bool:
+        """True si hay correos en cola que podrían salir ya (sin esperar tokens)."""
+        now = self.clock()
+        for tier in self._tiers:
+            for sender, queue in tier.items():
+                if not self._limited(sender) or queue[0][0] in self._charged:
+                    return True
+                bucket = self._buckets.get(sender)
+                if bucket is None or bucket.available(now):
+                    return True
+        return False
+
+    def mark_notified(self, sender: str) -> None:
+        """El aviso de límite se envió bien: no repetirlo en este episodio."""
+        self._notified.add(sender)
+
+    def _release_deferred(self, sender: str) -> None:
+        """Libera tantos aplazados como sitio haya en la cola: el próximo fetch los baja."""
+        deferred = self._deferred.get(sender)
+        if not deferred:
+            return
+        free = self.max_queue - self._queue_len(sender)
+        if free > 0:
+            del deferred[:free]
+        if not deferred:
+            del self._deferred[sender]
+
+    def take_throttled(self) -> List[Throttled]:
+        """
+        Remitentes limitados en este ciclo (sin token o con correos aplazados).
+        notify=True mientras no se haya confirmado un aviso en este episodio
+        (ver mark_notified), como mucho NOTICE_MAX_ATTEMPTS veces; el episodio
+        termina cuando no le queda nada pendiente.
+        """
+        now = self.clock()
+        limited = self._waiting | set(self._deferred)
+        out: List[Throttled] = []
+        for sender in sorted(limited):
+            notify = sender not in self._notified
+            if notify:
+                attempts = self._notice_attempts[sender] = self._notice_attempts.get(sender, 0) + 1
+                if attempts >= NOTICE_MAX_ATTEMPTS:
+                    self._notified.add(sender)  # último intento: no insistir en este episodio
+            out.append(Throttled(sender=sender, pending=self._pending(sender), notify=notify))
+
+        self._waiting = set()
+        for sender in list(self._deferred):
+            self._release_deferred(sender)
+        for sender in self._notified | set(self._notice_attempts):
+            if sender not in limited and not self._pending(sender):
+                self._notified.discard(sender)
+                self._notice_attempts.pop(sender, None)
+        for sender, bucket in list(self._buckets.items()):
+            if not self._queue_len(sender) and bucket.is_full(now):
+                del self._buckets[sender]
+        return out
@@ -2,17 +2,21 @@ import os
 import time
 import re
 from email.header import decode_header, make_header
-
-from sqlalchemy.exc import IntegrityError
+from functools import partial
+from typing import List, Optional, Tuple
 
 from app.email.mail_utils import connect_imap, fetch_unseen, mark_seen, send_mail, html_to_text
-from app.nlu.intent_router import extract_intent, humanize_result
+from app.email.scheduler import FairScheduler, Throttled
+from app.nlu.intent_router import extract_intents, humanize_result, is_cheap_request
 from app.db import SessionLocal
 from app.services import (
-    register_book, delete_book, reserve_book, renew_reservation, cancel_reservation, list_books
+    register_book, delete_book, reserve_book, renew_reservation, cancel_reservation, list_books,
+    run_batch,
 )
 
 POLL_SECONDS = int(os.getenv("POLL_SECONDS", "15"))
+# Máximo de operaciones por correo (el resto se informa como omitido)
+MAX_BATCH_OPS = int(os.getenv("MAX_BATCH_OPS", "50"))
 
 # --- Filtros desde .env (sencillos) ---
 ALLOWED_SENDERS = {s.strip().lower() for s in os.getenv("ALLOWED_SENDERS", "").split(",") if s.strip()}
@@ -32,6 +36,16 @@ def _subject_from(msg):
     return str(make_header(decode_header(msg.get("Subject", "")))).strip()
 
 
+def _skip_reason(sender: str, subject: str) -> Optional[str]:
+    """Filtros de .env: motivo para no procesar el correo, o None si pasa."""
+    if ALLOWED_SENDERS and sender not in ALLOWED_SENDERS:
+        return f"Skip: sender no permitido -> {sender}"
+    subj_low = subject.lower()
+    if SUBJECT_ACTIONS and not any(kw in subj_low for kw in SUBJECT_ACTIONS):
+        return f"Skip: asunto sin acción válida -> {subject}"
+    return None
+
+
 def _body_from(msg):
     if msg.is_multipart():
         for part in msg.walk():
@@ -48,151 +62,242 @@ def _body_from(msg):
     return ""
 
 
+def _nlu_text(msg) -> str:
+    """NLU con asunto + cuerpo (robusto si el cuerpo está vacío)."""
+    return f"{_subject_from(msg)}\n{_body_from(msg)}".strip()
+
+
+HELP_FOOTER = "¿Te ayudo con algo más? Puedes escribir: reservar, renovar, cancelar, registrar, eliminar, lista."
+
+
 def _format_reply(req: dict, natural: str) -> str:
     action = req.get("action")
     title_or_isbn = req.get("title") or req.get("isbn") or "(sin título/ISBN)"
     return (
         f"Tu solicitud: {action} sobre {title_or_isbn}.\n"
         f"{natural}\n\n"
-        "¿Te ayudo con algo más? Puedes escribir: reservar, renovar, cancelar, registrar, eliminar, lista."
+        f"{HELP_FOOTER}"
     )
 
 
+def _format_batch_reply(reqs: List[dict], results: List[Tuple[bool, str]], omitted: int) -> str:
+    """Una sola respuesta con el resultado de cada operación del lote."""
+    lines = [f"Tu solicitud incluía {len(reqs) + omitted} operaciones:"]
+    for i, (req, (_, natural)) in enumerate(zip(reqs, results, strict=True), start=1):
+        title_or_isbn = req.get("title") or req.get("isbn") or "(sin título/ISBN)"
+        lines.append(f"{i}. {req.get('action')} sobre {title_or_isbn}: {natural}")
+    ok = sum(1 for done, _ in results if done)
+    lines.append("")
+    lines.append(f"Resumen: {ok} correctas, {len(results) - ok} con error.")
+    if omitted:
+        lines.append(
+            f"No procesé {omitted} operaciones más (máximo {MAX_BATCH_OPS} por correo); envíalas en otro correo."
+        )
+    return "\n".join(lines) + f"\n\n{HELP_FOOTER}"
+
+
+def _execute(db, *, sender: str, req: dict) -> Tuple[bool, str]:
+    """
+    Ejecuta UNA operación sin confirmar (commit=False; confirma run_batch).
+    Devuelve (ok, texto para el usuario).
+    """
+    action = req.get("action")
+    isbn = (req.get("isbn") or "").strip()
+    title = (req.get("title") or "").strip()
+
+    if action == "register_book":
+        if not isbn or not title:
+            return False, humanize_result(action, False, 'Incluye ISBN y el título entre comillas ("Título").')
+        b, err = register_book(db, title=title, author="Desconocido", isbn=isbn, copies=1, commit=False)
+        return not err, humanize_result(
+            action,
+            not bool(err),
+            f"Registré '{b.title}' con ISBN {b.isbn}. Ya está disponible." if not err else err
+        )
+
+    if action == "delete_book":
+        if not isbn:
+            return False, humanize_result(action, False, "Para eliminar un libro, indica el ISBN (ej: isbn:978...).")
+        _, err = delete_book(db, isbn=isbn, commit=False)
+        return not err, humanize_result(action, not bool(err), "Libro eliminado." if not err else err)
+
+    if action == "reserve":
+        _, err = reserve_book(db, user_email=sender, isbn=isbn, commit=False)
+        return not err, humanize_result(
+            action, not bool(err),
+            "Reserva realizada exitosamente. ¡Disfrútalo! (tu correo quedó asociado a la reserva)." if not err else err
+        )
+
+    if action == "renew":
+        _, err = renew_reservation(db, user_email=sender, isbn=isbn, commit=False)
+        return not err, humanize_result(
+            action, not bool(err),
+            "Renovación exitosa por 7 días adicionales." if not err else err
+        )
+
+    if action == "cancel_reservation":
+        _, err = cancel_reservation(db, user_email=sender, isbn=isbn, commit=False)
+        return not err, humanize_result(
+            action, not bool(err),
+            "Reserva cancelada. El libro se considera devuelto; si lo necesitas de nuevo, vuelve a reservar." if not err else err
+        )
+
+    # list_books
+    books = list_books(db)
+    listado = "\n".join(
+        [f"- {b.title} (ISBN {b.isbn}) | disp: {b.copies_available}/{b.copies_total}" for b in books]
+    ) or "(sin libros)"
+    return True, humanize_result(action, True, f"Catálogo:\n{listado}")
+
+
 def process_email(msg):
     sender = _sender_from(msg)
-    subject = _subject_from(msg)
 
     # --- Filtros mínimos y claros ---
-    if ALLOWED_SENDERS and sender not in ALLOWED_SENDERS:
-        raise RuntimeError(f"Skip: sender no permitido -> {sender}")
+    skip = _skip_reason(sender, _subject_from(msg))
+    if skip:
+        raise RuntimeError(skip)
 
-    subj_low = subject.lower()
-    if SUBJECT_ACTIONS and not any(kw in subj_low for kw in SUBJECT_ACTIONS):
-        raise RuntimeError(f"Skip: asunto sin acción válida -> {subject}")
+    text_for_nlu = _nlu_text(msg)
 
-    # NLU con asunto + cuerpo (robusto si el cuerpo está vacío)
-    body = _body_from(msg)
-    text_for_nlu = f"{subject}\n{body}".strip()
-
-    req = extract_intent(text_for_nlu, sender)
-    action = req.get("action")
-    isbn = (req.get("isbn") or "").strip()
-    title = (req.get("title") or "").strip()
+    # Una o varias operaciones (una por línea/ISBN) -> una sola transacción
+    reqs = extract_intents(text_for_nlu, sender)
+    omitted = max(0, len(reqs) - MAX_BATCH_OPS)
+    reqs = reqs[:MAX_BATCH_OPS]
 
     db = SessionLocal()
     try:
-        if action == "register_book":
-            if not isbn or not title:
-                natural = humanize_result(action, False, 'Incluye ISBN y el título entre comillas ("Título").')
-            else:
-                try:
-                    # Soporta ambas firmas de services.register_book:
-                    # 1) (book, err)
-                    # 2) book (solo objeto)
-                    result = register_book(db, title=title, author="Desconocido", isbn=isbn, copies=1)
-                    if isinstance(result, tuple) and len(result) == 2:
-                        b, err = result
-                        natural = humanize_result(
-                            action,
-                            not bool(err),
-                            f"Registré '{b.title}' con ISBN {b.isbn}. Ya está disponible." if not err else err
-                        )
-                    else:
-                        b = result  # type: ignore[assignment]
-                        natural = humanize_result(action, True, f"Registré '{b.title}' con ISBN {b.isbn}. Ya está disponible.")
-                except IntegrityError:
-                    natural = humanize_result(action, False, "El ISBN ya existe en el catálogo.")
-                except Exception as e:
-                    natural = humanize_result(action, False, f"No pude registrar el libro: {e}")
-
-        elif action == "delete_book":
-            if not isbn:
-                natural = humanize_result(action, False, "Para eliminar un libro, indica el ISBN (ej: isbn:978...).")
-            else:
-                _, err = delete_book(db, isbn=isbn)
-                natural = humanize_result(action, not bool(err), "Libro eliminado." if not err else err)
-
-        elif action == "reserve":
-            _, err = reserve_book(db, user_email=sender, isbn=isbn)
-            natural = humanize_result(
-                action, not bool(err),
-                "Reserva realizada exitosamente. ¡Disfrútalo! (tu correo quedó asociado a la reserva)." if not err else err
-            )
-
-        elif action == "renew":
-            _, err = renew_reservation(db, user_email=sender, isbn=isbn)
-            natural = humanize_result(
-                action, not bool(err),
-                "Renovación exitosa por 7 días adicionales." if not err else err
-            )
-
-        elif action == "cancel_reservation":
-            _, err = cancel_reservation(db, user_email=sender, isbn=isbn)
-            natural = humanize_result(
-                action, not bool(err),
-                "Reserva cancelada. El libro se considera devuelto; si lo necesitas de nuevo, vuelve a reservar." if not err else err
-            )
-
-        else:  # list_books
-            books = list_books(db)
-            listado = "\n".join(
-                [f"- {b.title} (ISBN {b.isbn}) | disp: {b.copies_available}/{b.copies_total}" for b in books]
-            ) or "(sin libros)"
-            natural = humanize_result(action, True, f"Catálogo:\n{listado}")
-
-        # ⬇️ AHORA devolvemos 3 valores (para que run() no falle)
-        return sender, _format_reply(req, natural), req
+        batch = run_batch(db, [partial(_execute, sender=sender, req=req) for req in reqs])
+        results = [
+            res if not err else (False, humanize_result(req.get("action"), False, err))
+            for req, (res, err) in zip(reqs, batch, strict=True)
+        ]
+
+        if len(reqs) == 1 and not omitted:
+            reply = _format_reply(reqs[0], results[0][1])
+        else:
+            reply = _format_batch_reply(reqs, results, omitted)
+
+        # Devolvemos 3 valores: destinatario, texto, operaciones interpretadas
+        return sender, reply, reqs
 
     finally:
         db.close()
 
 
+def _handle(client, uid, msg) -> bool:
+    """
+    Procesa un correo y responde; solo se marca leído si el envío fue OK.
+    Devuelve True si quedó marcado leído.
+    """
+    try:
+        # logs básicos del correo
+        subject = str(make_header(decode_header(msg.get("Subject", ""))))
+        sender_header = str(make_header(decode_header(msg.get("From", ""))))
+        print(f"[MAIL] UID={uid} FROM={sender_header} SUBJECT={subject}", flush=True)
+
+        # procesa NLU (NO marcar leído si hay Skip/ERROR)
+        try:
+            to_addr, text, reqs = process_email(msg)
+        except RuntimeError as skip_reason:
+            print(f"[SKIP] UID={uid} {skip_reason}", flush=True)
+            return False
+        except Exception as e:
+            print(f"[ERROR] UID={uid} fallo en process_email: {repr(e)}", flush=True)
+            return False
+
+        # log de intención (una línea por operación)
+        for req in reqs or []:
+            action = req.get("action")
+            isbn = req.get("isbn")
+            title = req.get("title")
+            print(f"[NLU]  UID={uid} action={action} isbn={isbn} title={title}", flush=True)
+
+        # enviar por SMTP
+        print(f"[SMTP] UID={uid} -> enviando a {to_addr}", flush=True)
+        res = send_mail(to_addr, "Biblioteca — Respuesta", text)
+        print(f"[SMTP] UID={uid} sendmail result: {res}", flush=True)
+
+        # SOLO si send_mail fue OK (dict vacío) marcamos como leído
+        if not res:
+            mark_seen(client, uid)
+            print(f"[SEEN] UID={uid} marcado como leído", flush=True)
+            return True
+        print(f"[WARN] UID={uid} no marcado leído; fallos: {res}", flush=True)
+        return False
+
+    except Exception as e:
+        import traceback
+        print(f"[ERROR] UID={uid} excepción no controlada: {repr(e)}", flush=True)
+        traceback.print_exc()
+        return False
+
+
+def _slow_down_text(t: Throttled, rate_per_min: float) -> str:
+    lines = [
+        "Recibimos muchas solicitudes desde tu dirección en poco tiempo.",
+        f"Para ser justos con todos, atendemos como máximo {rate_per_min:g} por minuto por remitente.",
+    ]
+    if t.pending:
+        lines.append(f"{t.pending} quedan en espera y se procesarán en orden, sin que tengas que reenviarlas.")
+    return "\n".join(lines) + f"\n\n{HELP_FOOTER}"
+
+
+def _handle_throttled(scheduler: FairScheduler):
+    """Un solo aviso por remitente limitado; sus correos siguen UNSEEN hasta su turno."""
+    for t in scheduler.take_throttled():
+        print(f"[RATE] {t.sender} pendientes={t.pending}", flush=True)
+        if not t.notify:
+            continue
+        try:
+            res = send_mail(t.sender, "Biblioteca — Demasiadas solicitudes", _slow_down_text(t, scheduler.rate_per_min))
+            print(f"[RATE] aviso a {t.sender} sendmail result: {res}", flush=True)
+            # Solo si el envío fue OK; si no, se reintenta en el próximo ciclo limitado
+            if not res:
+                scheduler.mark_notified(t.sender)
+        except Exception as e:
+            print(f"[ERROR] aviso de límite a {t.sender}: {repr(e)}", flush=True)
+
+
+def poll_once(client, scheduler: FairScheduler):
+    """
+    Un ciclo de lectura: baja los UNSEEN nuevos al planificador y procesa una
+    vuelta del round-robin (un correo por remitente, reglas antes que LLM, con
+    límite por remitente). Lo que quede en cola sale en los siguientes ciclos.
+    Las excepciones de IMAP (conexión caída, etc.) se propagan a run().
+    """
+    for uid, msg in fetch_unseen(client, skip_uids=scheduler.pending_uids()):
+        # Un correo que no se puede decodificar no debe frenar a los demás
+        try:
+            sender = _sender_from(msg)
+            # Lo que process_email descartaría no pasa por el planificador
+            # (no gasta tokens ni provoca avisos de límite)
+            skip = _skip_reason(sender, _subject_from(msg))
+            if skip:
+                print(f"[SKIP] UID={uid} {skip}", flush=True)
+                continue
+            # Solo prioridad de planificación; la NLU decide igual que siempre
+            cheap = is_cheap_request(_nlu_text(msg))
+        except Exception as e:
+            print(f"[ERROR] UID={uid} no se pudo leer el correo: {repr(e)}", flush=True)
+            continue
+        scheduler.add(uid, msg, sender=sender, cheap=cheap)
+
+    for uid, msg in scheduler.ready():
+        if _handle(client, uid, msg):
+            scheduler.done(uid)
+
+    _handle_throttled(scheduler)
+
+
 def run():
     client = connect_imap()
+    scheduler = FairScheduler()
     print("[WORKER] Iniciado. Esperando correos...", flush=True)
 
     while True:
         try:
-            for uid, msg in fetch_unseen(client):
-                try:
-                    # logs básicos del correo
-                    subject = str(make_header(decode_header(msg.get("Subject", ""))))
-                    sender_header = str(make_header(decode_header(msg.get("From", ""))))
-                    print(f"[MAIL] UID={uid} FROM={sender_header} SUBJECT={subject}", flush=True)
-
-                    # procesa NLU (NO marcar leído si hay Skip/ERROR)
-                    try:
-                        to_addr, text, req = process_email(msg)
-                    except RuntimeError as skip_reason:
-                        print(f"[SKIP] UID={uid} {skip_reason}", flush=True)
-                        continue
-                    except Exception as e:
-                        print(f"[ERROR] UID={uid} fallo en process_email: {repr(e)}", flush=True)
-                        continue
-
-                    # log de intención
-                    action = (req or {}).get("action")
-                    isbn = (req or {}).get("isbn")
-                    title = (req or {}).get("title")
-                    print(f"[NLU]  UID={uid} action={action} isbn={isbn} title={title}", flush=True)
-
-                    # enviar por SMTP
-                    print(f"[SMTP] UID={uid} -> enviando a {to_addr}", flush=True)
-                    res = send_mail(to_addr, "Biblioteca — Respuesta", text)
-                    print(f"[SMTP] UID={uid} sendmail result: {res}", flush=True)
-
-                    # SOLO si send_mail fue OK (dict vacío) marcamos como leído
-                    if not res:
-                        mark_seen(client, uid)
-                        print(f"[SEEN] UID={uid} marcado como leído", flush=True)
-                    else:
-                        print(f"[WARN] UID={uid} no marcado leído; fallos: {res}", flush=True)
-
-                except Exception as e:
-                    import traceback
-                    print(f"[ERROR] UID={uid} excepción no controlada: {repr(e)}", flush=True)
-                    traceback.print_exc()
-
+            poll_once(client, scheduler)
         except Exception as loop_error:
             print(f"[LOOP] Error en ciclo principal: {repr(loop_error)}", flush=True)
             try:
@@ -201,7 +306,9 @@ def run():
                 time.sleep(3)
                 client = connect_imap()
 
-        time.sleep(POLL_SECONDS)
+        # Con trabajo listo en cola, volvemos a leer enseguida (otra vuelta del round-robin)
+        if not scheduler.has_ready():
+            time.sleep(POLL_SECONDS)
 
 
 if __name__ == "__main__":
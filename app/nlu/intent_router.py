@@ -4,11 +4,12 @@ from __future__ import annotations
 import json
 import os
 import re
-from typing import Optional, TypedDict, Literal
+from typing import List, Optional, TypedDict, Literal
 
-SYSTEM = """Eres un asistente que traduce correos a una intención de biblioteca.
-Devuelve SOLO un JSON válido que siga este schema:
-{ "action": "...", "user_email": "...", "title": "...", "isbn": "..." }
+SYSTEM = """Eres un asistente que traduce correos a intenciones de biblioteca.
+Devuelve SOLO un JSON válido: una lista con un objeto por operación, siguiendo este schema:
+[{ "action": "...", "user_email": "...", "title": "...", "isbn": "..." }]
+Si el correo pide varias operaciones (una por línea o varios ISBN), devuelve un objeto por cada una.
 Acciones permitidas: reserve, renew, cancel_reservation, register_book, delete_book, list_books.
 """
 
@@ -59,21 +60,25 @@ def _normalize_action(a: Optional[str]) -> Action:
     a2 = aliases.get(a, a)
     return a2 if a2 in ALLOWED_ACTIONS else "list_books"
 
+def _detect_action(t: str) -> Optional[Action]:
+    """Acción según palabras clave (texto ya en minúsculas); None si no hay ninguna."""
+    if "registrar" in t:
+        return "register_book"
+    if "eliminar libro" in t or "eliminar" in t or "borrar libro" in t:
+        return "delete_book"
+    if "reservar" in t:
+        return "reserve"
+    if "renovar" in t:
+        return "renew"
+    if "cancelar" in t or "eliminar reserva" in t:
+        return "cancel_reservation"
+    if "lista" in t or "listar" in t or "catalogo" in t or "catálogo" in t:
+        return "list_books"
+    return None
+
 def _fallback_rules(text: str, sender_email: Optional[str]) -> Intent:
     t = (text or "").lower()
-    action: Action = "list_books"
-    if "registrar" in t:
-        action = "register_book"
-    elif "eliminar libro" in t or "eliminar" in t or "borrar libro" in t:
-        action = "delete_book"
-    elif "reservar" in t:
-        action = "reserve"
-    elif "renovar" in t:
-        action = "renew"
-    elif "cancelar" in t or "eliminar reserva" in t:
-        action = "cancel_reservation"
-    elif "lista" in t or "listar" in t or "catalogo" in t or "catálogo" in t:
-        action = "list_books"
+    action: Action = _detect_action(t) or "list_books"
 
     m = re.search(r"(?:isbn[:\s]?)([\d-]{10,17})", t) or re.search(r"\b(\d{10,13})\b", t)
     isbn = m.group(1).replace("-", "") if m else None
@@ -83,9 +88,92 @@ def _fallback_rules(text: str, sender_email: Optional[str]) -> Intent:
 
     return {"action": action, "user_email": sender_email, "isbn": isbn, "title": title}
 
-def _llm_intent(system_prompt: str, text: str) -> Optional[Intent]:
+_ISBN_ANY = re.compile(r"(isbn[:\s]?\s*)?\b(\d[\d-]{8,15}[\dx])\b")
+
+def _looks_like_isbn(isbn: str) -> bool:
+    """Prefijo 978/979 o dígito de control válido (ISBN-13 / ISBN-10)."""
+    if len(isbn) == 13 and isbn.isdigit():
+        if isbn[:3] in ("978", "979"):
+            return True
+        return sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(isbn)) % 10 == 0
+    if len(isbn) == 10 and isbn[:9].isdigit() and (isbn[9].isdigit() or isbn[9] == "x"):
+        digits = [int(d) for d in isbn[:9]] + [10 if isbn[9] == "x" else int(isbn[9])]
+        return sum((10 - i) * d for i, d in enumerate(digits)) % 11 == 0
+    return False
+
+def _line_isbns(line: str) -> List[str]:
+    """
+    ISBN de una línea (ya en minúsculas). Con etiqueta "isbn" basta la longitud;
+    un número suelto solo cuenta si parece ISBN (evita teléfonos, pedidos, etc.).
+    """
+    out = []
+    for label, raw in _ISBN_ANY.findall(line):
+        isbn = raw.replace("-", "")
+        if not 10 <= len(isbn) <= 13:
+            continue
+        if label or _looks_like_isbn(isbn):
+            out.append(isbn.upper())
+    return out
+
+# Inicio del texto citado sin ">" (Outlook, Gmail, móviles), de la firma o de
+# una respuesta anterior del propio bot (una línea por libro con su ISBN)
+_QUOTE_START = re.compile(
+    r"^(de|from):"
+    r"|\b(escribió|wrote):$"
+    r"|^-+\s*(original message|mensaje original)\s*-*$"
+    r"|^--$"
+    r"|^tu solicitud\b"
+    r"|catálogo:$"
+)
+
+def _own_text(text: str) -> str:
+    """Solo lo que escribió el remitente: sin líneas "> ..." y hasta la primera cita o firma."""
+    lines = []
+    for line in (text or "").splitlines():
+        low = line.strip().lower()
+        if _QUOTE_START.search(low):
+            break
+        if not low.startswith(">"):
+            lines.append(line)
+    return "\n".join(lines)
+
+def _rules_intents(text: str, sender_email: Optional[str]) -> List[Intent]:
+    """
+    Varias operaciones por correo: una por ISBN encontrado, línea a línea.
+    Solo cuenta el texto propio del correo (ver _own_text): el catálogo o la
+    firma citados en una respuesta no generan operaciones.
+    La acción de cada línea sale de sus propias palabras clave o, si no tiene,
+    de la acción general del correo (asunto + cuerpo). El título entre comillas
+    solo se asocia si la línea tiene un único ISBN.
+    Con 0 o 1 operación se usa _fallback_rules sobre ese mismo texto.
+    """
+    text = _own_text(text)
+    default = _fallback_rules(text, sender_email)
+    if default["action"] == "list_books":
+        return [default]
+
+    ops: List[Intent] = []
+    seen = set()
+    for line in text.splitlines():
+        isbns = _line_isbns(line.lower())
+        if not isbns:
+            continue
+        line_action = _detect_action(line.lower())
+        action = line_action if line_action and line_action != "list_books" else default["action"]
+        m = re.search(r'["\'](.+?)["\']', line)
+        title = m.group(1).strip() if m and len(isbns) == 1 else None
+        for isbn in isbns:
+            if (action, isbn) in seen:
+                continue
+            seen.add((action, isbn))
+            ops.append({"action": action, "user_email": sender_email, "isbn": isbn, "title": title})
+
+    return ops if len(ops) > 1 else [default]
+
+def _llm_intents(system_prompt: str, text: str) -> Optional[List[Intent]]:
     """
     Invoca ChatOpenAI SIN templates para evitar conflicto con llaves.
+    Acepta tanto una lista de operaciones como un objeto suelto.
     """
     try:
         from langchain_openai import ChatOpenAI
@@ -101,26 +189,43 @@ def _llm_intent(system_prompt: str, text: str) -> Optional[Intent]:
         raw = (resp.content or "").strip()
         cleaned = _strip_code_fences(raw)
         data = json.loads(cleaned)
+        items = data if isinstance(data, list) else [data]
 
-        data["action"] = _normalize_action(data.get("action"))
-        return data  # type: ignore[return-value]
+        ops = [d for d in items if isinstance(d, dict)]
+        for d in ops:
+            d["action"] = _normalize_action(d.get("action"))
+        return ops  # type: ignore[return-value]
     except Exception as e:
         print(f"[NLU/LLM] Error invocando LLM: {repr(e)}", flush=True)
         return None
 
-def extract_intent(text: str, sender_email: Optional[str]) -> Intent:
+def is_cheap_request(text: str) -> bool:
+    """
+    Pista para el planificador (no cambia cómo se interpreta el correo):
+    True si probablemente no gaste LLM, es decir USE_LLM=false o un pedido
+    explícito de lista sin otra acción.
+    """
+    if os.getenv("USE_LLM", "false").lower() != "true":
+        return True
+    return _detect_action(_own_text(text).lower()) == "list_books"
+
+def extract_intents(text: str, sender_email: Optional[str]) -> List[Intent]:
+    """
+    Lista de operaciones pedidas en el correo (al menos una).
+    """
     use_llm = os.getenv("USE_LLM", "false").lower() == "true"
     text = (text or "").strip()
 
     if use_llm:
-        data = _llm_intent(SYSTEM, text)
-        if isinstance(data, dict) and data.get("action"):
-            if sender_email and not data.get("user_email"):
-                data["user_email"] = sender_email
-            data["action"] = _normalize_action(data.get("action"))
-            return data  # type: ignore[return-value]
-
-    return _fallback_rules(text, sender_email)
+        data = _llm_intents(SYSTEM, _own_text(text))
+        ops = [d for d in (data or []) if d.get("action")]
+        if ops:
+            for d in ops:
+                if sender_email and not d.get("user_email"):
+                    d["user_email"] = sender_email
+            return ops
+
+    return _rules_intents(text, sender_email)
 
 def humanize_result(action: Action, success: bool, detail: str) -> str:
     prefix = {
@@ -1,6 +1,6 @@
 # app/services.py
 from datetime import datetime, timedelta
-from typing import Tuple, Optional, List
+from typing import Any, Callable, Tuple, Optional, List
 
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
@@ -12,13 +12,27 @@ def init_db(engine):
     models.Base.metadata.create_all(bind=engine)
 
 
+def _save(db: Session, obj, commit: bool):
+    """
+    commit=True: confirma y refresca (una transacción por llamada).
+    commit=False: solo flush; confirma quien llama (ver run_batch).
+    """
+    if commit:
+        db.commit()
+        db.refresh(obj)
+    else:
+        db.flush()
+
+
 def register_book(
-    db: Session, *, title: str, author: str, isbn: str, copies: int = 1
+    db: Session, *, title: str, author: str, isbn: str, copies: int = 1, commit: bool = True
 ) -> Tuple[Optional[models.Book], Optional[str]]:
     """
     Registra un libro nuevo.
     Devuelve: (Book|None, err|None)
     - Si el ISBN ya existe, retorna (None, "El ISBN ya existe en el catálogo.")
+    - commit=False: no confirma; el INSERT va en un SAVEPOINT para que un ISBN
+      duplicado no invalide la transacción del llamador.
     """
     # Opción 1: verificar duplicado antes (más claro que depender de la excepción)
     existing = db.query(models.Book).filter_by(isbn=isbn, active=True).first()
@@ -33,6 +47,14 @@ def register_book(
         copies_available=copies,
         active=True,
     )
+    if not commit:
+        try:
+            with db.begin_nested():
+                db.add(book)
+            return book, None
+        except IntegrityError:
+            return None, "El ISBN ya existe en el catálogo."
+
     db.add(book)
     try:
         db.commit()
@@ -46,18 +68,18 @@ def register_book(
         return None, f"Error registrando el libro: {e}"
 
 
-def delete_book(db: Session, *, isbn: str):
+def delete_book(db: Session, *, isbn: str, commit: bool = True):
     b = db.query(models.Book).filter_by(isbn=isbn, active=True).first()
     if not b:
         return None, "Libro no encontrado"
     if b.copies_available != b.copies_total:
         return None, "No se puede eliminar: hay reservas activas"
     b.active = False
-    db.commit()
+    _save(db, b, commit)
     return b, None
 
 
-def reserve_book(db: Session, *, user_email: str, isbn: str):
+def reserve_book(db: Session, *, user_email: str, isbn: str, commit: bool = True):
     b = db.query(models.Book).filter_by(isbn=isbn, active=True).first()
     if not b:
         return None, "Libro no encontrado"
@@ -79,12 +101,11 @@ def reserve_book(db: Session, *, user_email: str, isbn: str):
     )
     b.copies_available -= 1
     db.add(res)
-    db.commit()
-    db.refresh(res)
+    _save(db, res, commit)
     return res, None
 
 
-def renew_reservation(db: Session, *, user_email: str, isbn: str):
+def renew_reservation(db: Session, *, user_email: str, isbn: str, commit: bool = True):
     b = db.query(models.Book).filter_by(isbn=isbn, active=True).first()
     if not b:
         return None, "Libro no encontrado"
@@ -98,12 +119,11 @@ def renew_reservation(db: Session, *, user_email: str, isbn: str):
     if res.due_date < datetime.utcnow():
         return None, "La reserva ya venció"
     res.due_date = res.due_date + timedelta(days=7)
-    db.commit()
-    db.refresh(res)
+    _save(db, res, commit)
     return res, None
 
 
-def cancel_reservation(db: Session, *, user_email: str, isbn: str):
+def cancel_reservation(db: Session, *, user_email: str, isbn: str, commit: bool = True):
     b = db.query(models.Book).filter_by(isbn=isbn, active=True).first()
     if not b:
         return None, "Libro no encontrado"
@@ -116,11 +136,44 @@ def cancel_reservation(db: Session, *, user_email: str, isbn: str):
         return None, "No hay reserva activa para cancelar"
     res.status = "cancelled"
     b.copies_available += 1
-    db.commit()
-    db.refresh(res)
+    _save(db, res, commit)
     return res, None
 
 
 def list_books(db: Session):
     return db.query(models.Book).filter_by(active=True).all()
 
+
+def run_batch(db: Session, operations: List[Callable[[Session], Any]]) -> List[Tuple[Any, Optional[str]]]:
+    """
+    Ejecuta varias operaciones (servicios con commit=False) en UNA transacción
+    y con UN solo commit al final.
+    Cada operación corre en su propio SAVEPOINT: si falla por un dato del propio
+    ítem (restricción de integridad, valor inválido) solo se revierte esa
+    operación y el resto del lote sigue.
+    Cualquier otro error (ej: OperationalError "database is locked") revierte
+    el lote entero y se propaga, para que el correo quede UNSEEN y se reintente.
+    Devuelve una lista paralela de (resultado|None, err|None).
+    """
+    results: List[Tuple[Any, Optional[str]]] = []
+    try:
+        for i, op in enumerate(operations, start=1):
+            try:
+                with db.begin_nested():
+                    results.append((op(db), None))
+            except IntegrityError as e:
+                # El detalle (SQL y parámetros) va al log, no al correo del usuario
+                print(f"[DB] operación {i} del lote revertida: {repr(e)}", flush=True)
+                results.append((None, "Los datos entran en conflicto con el catálogo (ej: ISBN duplicado)."))
+            except ValueError as e:
+                print(f"[DB] operación {i} del lote revertida: {repr(e)}", flush=True)
+                results.append((None, "Algún dato de la solicitud no es válido."))
+    except Exception:
+        db.rollback()
+        raise
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return results
@@ -0,0 +1,195 @@
+# bench/corpus.py
+"""
+Corpus sintético y determinista (semilla fija) para los benchmarks del worker.
+
+Cada correo usa el mismo formato que escribiría un usuario real, de modo que
+tanto las reglas como el LLM simulado lo entiendan igual:
+  - asunto con la palabra clave (reservar, renovar, ...)
+  - ISBN como "isbn:978..." y título entre comillas
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from typing import Dict, List, Tuple
+
+# Mezcla por defecto (pesos relativos) de acciones
+DEFAULT_MIX: Dict[str, float] = {
+    "reserve": 0.35,
+    "renew": 0.15,
+    "cancel_reservation": 0.10,
+    "register_book": 0.10,
+    "delete_book": 0.05,
+    "list_books": 0.25,
+}
+
+SUBJECTS = {
+    "reserve": "Reservar libro",
+    "renew": "Renovar reserva",
+    "cancel_reservation": "Cancelar reserva",
+    "register_book": "Registrar libro",
+    "delete_book": "Eliminar libro",
+    "list_books": "Lista de libros",
+}
+
+# Relleno sin palabras clave ni dígitos (no debe alterar la intención detectada)
+_FILLER_WORDS = (
+    "lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do",
+    "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua", "ut",
+    "enim", "ad", "minim", "veniam", "quis", "nostrud",
+)
+
+
+@dataclass
+class CorpusConfig:
+    messages: int = 200
+    senders: int = 20
+    html_ratio: float = 0.3
+    body_bytes: int = 512
+    catalog_size: int = 50
+    mix: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_MIX))
+    ops_per_mail: int = 1
+    sender_prefix: str = "lector"
+    seed: int = 1234
+
+
+@dataclass
+class SyntheticMail:
+    sender: str
+    action: str
+    raw: bytes
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """
+    "reserve=3,list_books=1" -> {"reserve": 3.0, "list_books": 1.0}
+    """
+    mix: Dict[str, float] = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SUBJECTS:
+            raise ValueError(f"Acción desconocida en la mezcla: {name}")
+        mix[name] = float(weight or 1)
+    if not mix:
+        raise ValueError("La mezcla de acciones está vacía")
+    return mix
+
+
+def catalog(size: int) -> List[Tuple[str, str]]:
+    """Libros iniciales: [(isbn, título)]."""
+    return [(f"978{i:010d}", f"Libro de prueba {chr(65 + i % 26)}{i // 26}") for i in range(size)]
+
+
+def sender_address(i: int, prefix: str = "lector") -> str:
+    return f"{prefix}{i:04d}@bench.local"
+
+
+def _filler(rng: random.Random, size: int) -> str:
+    words: List[str] = []
+    total = 0
+    while total < size:
+        w = rng.choice(_FILLER_WORDS)
+        words.append(w)
+        total += len(w) + 1
+    return " ".join(words)
+
+
+def _command_text(action: str, items: List[Tuple[str, str]]) -> str:
+    """Una línea por ISBN (así se piden varias operaciones en un correo)."""
+    if action == "list_books":
+        return "Envíame la lista, por favor"
+    if len(items) > 1:
+        verb = {
+            "register_book": "registrar",
+            "delete_book": "eliminar",
+            "reserve": "reservar",
+            "renew": "renovar",
+            "cancel_reservation": "cancelar",
+        }[action]
+        if action == "register_book":
+            lines = [f'"{title}" isbn:{isbn}' for isbn, title in items]
+        else:
+            lines = [f"isbn:{isbn}" for isbn, _ in items]
+        return f"Por favor {verb} estos libros:\n" + "\n".join(lines)
+
+    isbn, title = items[0]
+    if action == "register_book":
+        return f'Por favor registrar "{title}" isbn:{isbn}'
+    if action == "delete_book":
+        return f"Por favor eliminar libro isbn:{isbn}"
+    if action == "reserve":
+        return f"Quiero reservar isbn:{isbn}"
+    if action == "renew":
+        return f"Quiero renovar isbn:{isbn}"
+    return f"Quiero cancelar isbn:{isbn}"
+
+
+def build_message(
+    *, sender: str, to_addr: str, action: str, text: str, html: bool, filler: str
+) -> bytes:
+    msg = EmailMessage()
+    msg["From"] = f"Lector <{sender}>"
+    msg["To"] = to_addr
+    msg["Subject"] = SUBJECTS[action]
+    msg["Date"] = formatdate(localtime=True)
+    msg["Message-Id"] = make_msgid("bench")
+    if html:
+        # multipart solo con HTML: obliga al worker a pasar por html_to_text()
+        msg.set_content(f"<html><body><p>{text}</p><p>{filler}</p></body></html>", subtype="html")
+        msg.make_alternative()
+    else:
+        msg.set_content(f"{text}\n\n{filler}\n")
+    return msg.as_bytes()
+
+
+def generate(cfg: CorpusConfig, to_addr: str) -> List[SyntheticMail]:
+    """
+    Genera cfg.messages correos con cfg.ops_per_mail operaciones cada uno.
+    Las reservas/renovaciones/cancelaciones se hacen sobre el catálogo inicial;
+    los registros usan ISBN nuevos y los borrados apuntan a libros registrados
+    antes en el mismo corpus (si hay).
+    """
+    rng = random.Random(cfg.seed)
+    books = catalog(cfg.catalog_size)
+    actions = list(cfg.mix)
+    weights = [cfg.mix[a] for a in actions]
+    registered: List[str] = []
+    n_ops = max(cfg.ops_per_mail, 1)
+    next_new = 0
+
+    out: List[SyntheticMail] = []
+    for _ in range(cfg.messages):
+        action = rng.choices(actions, weights)[0]
+        sender = sender_address(rng.randrange(max(cfg.senders, 1)), cfg.sender_prefix)
+        if action == "register_book":
+            items = []
+            for _ in range(n_ops):
+                items.append((f"979{next_new:010d}", f"Nuevo titulo {next_new}"))
+                registered.append(items[-1][0])
+                next_new += 1
+        elif action == "delete_book" and registered:
+            items = [
+                (registered.pop(rng.randrange(len(registered))), "")
+                for _ in range(min(n_ops, len(registered)))
+            ]
+        elif books:
+            items = rng.sample(books, min(n_ops, len(books)))
+        else:
+            items = [("9780000000000", "Sin catálogo")]
+
+        raw = build_message(
+            sender=sender,
+            to_addr=to_addr,
+            action=action,
+            text=_command_text(action, items),
+            html=rng.random() < cfg.html_ratio,
+            filler=_filler(rng, cfg.body_bytes),
+        )
+        out.append(SyntheticMail(sender=sender, action=action, raw=raw))
+    return out
@@ -0,0 +1,291 @@
+# bench/fake_servers.py
+"""
+Servidores IMAP y SMTP mínimos, en proceso y sin TLS, para benchmarks.
+
+Implementan solo lo que usan imaplib/smtplib desde app.email.mail_utils:
+  - IMAP: CAPABILITY, LOGIN, SELECT, UID SEARCH UNSEEN, UID FETCH (RFC822),
+    UID STORE +FLAGS (\\Seen), NOOP, LOGOUT.
+  - SMTP: EHLO/HELO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, RSET, NOOP, QUIT.
+
+A diferencia de un IMAP real, FETCH RFC822 NO marca \\Seen: el worker lo marca
+explícitamente con STORE, y ese instante se usa como fin de la latencia e2e.
+"""
+from __future__ import annotations
+
+import re
+import socketserver
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+# =========================
+# Estado compartido
+# =========================
+@dataclass
+class StoredMessage:
+    uid: int
+    raw: bytes
+    sender: str = ""
+    appended_at: float = 0.0
+    seen_at: Optional[float] = None
+
+
+@dataclass
+class Mailbox:
+    """
+    INBOX en memoria. Los tiempos usan time.perf_counter() para poder comparar
+    con las mediciones del benchmark en el mismo proceso.
+    """
+    messages: Dict[int, StoredMessage] = field(default_factory=dict)
+    next_uid: int = 1
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def append(self, raw: bytes, sender: str = "") -> int:
+        with self.lock:
+            uid = self.next_uid
+            self.next_uid += 1
+            self.messages[uid] = StoredMessage(
+                uid=uid, raw=raw, sender=sender, appended_at=time.perf_counter()
+            )
+            return uid
+
+    def unseen_uids(self) -> List[int]:
+        with self.lock:
+            return [uid for uid, m in self.messages.items() if m.seen_at is None]
+
+    def get(self, uid: int) -> Optional[StoredMessage]:
+        with self.lock:
+            return self.messages.get(uid)
+
+    def mark_seen(self, uid: int) -> None:
+        with self.lock:
+            m = self.messages.get(uid)
+            if m and m.seen_at is None:
+                m.seen_at = time.perf_counter()
+
+    def snapshot(self) -> List[StoredMessage]:
+        with self.lock:
+            return list(self.messages.values())
+
+
+@dataclass
+class Outbox:
+    """Correos recibidos por el SMTP falso."""
+    sent: List[dict] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, mail_from: str, rcpts: List[str], data: bytes) -> None:
+        with self.lock:
+            self.sent.append(
+                {"from": mail_from, "to": rcpts, "data": data, "at": time.perf_counter()}
+            )
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.sent)
+
+
+# =========================
+# IMAP
+# =========================
+_IMAP_CMD = re.compile(rb"^(?P<tag>\S+) (?P<cmd>[A-Za-z]+)(?: (?P<args>.*))?$")
+
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    server: "_IMAPServer"
+    disable_nagle_algorithm = True  # sin esto cada respuesta multilínea paga ~40ms
+
+    def _send(self, line: str | bytes) -> None:
+        if isinstance(line, str):
+            line = line.encode()
+        self.wfile.write(line + b"\r\n")
+
+    def handle(self):
+        mailbox = self.server.mailbox
+        self._send("* OK [CAPABILITY IMAP4rev1 AUTH=PLAIN] fake-imap listo")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            m = _IMAP_CMD.match(line.rstrip(b"\r\n"))
+            if not m:
+                self._send("* BAD comando inválido")
+                continue
+            tag = m.group("tag").decode()
+            cmd = m.group("cmd").decode().upper()
+            args = (m.group("args") or b"").decode(errors="ignore")
+
+            if cmd == "CAPABILITY":
+                self._send("* CAPABILITY IMAP4rev1 AUTH=PLAIN")
+                self._send(f"{tag} OK CAPABILITY completado")
+            elif cmd == "LOGIN":
+                self._send(f"{tag} OK LOGIN completado")
+            elif cmd in ("SELECT", "EXAMINE"):
+                total = len(mailbox.snapshot())
+                self._send(f"* {total} EXISTS")
+                self._send("* 0 RECENT")
+                self._send("* FLAGS (\\Seen)")
+                self._send(f"{tag} OK [READ-WRITE] {cmd} completado")
+            elif cmd == "UID":
+                self._handle_uid(tag, args)
+            elif cmd == "NOOP":
+                self._send(f"{tag} OK NOOP completado")
+            elif cmd == "LOGOUT":
+                self._send("* BYE fake-imap cerrando")
+                self._send(f"{tag} OK LOGOUT completado")
+                return
+            else:
+                self._send(f"{tag} BAD comando no soportado: {cmd}")
+
+    def _handle_uid(self, tag: str, args: str) -> None:
+        mailbox = self.server.mailbox
+        parts = args.split(" ", 1)
+        sub = parts[0].upper()
+        rest = parts[1] if len(parts) > 1 else ""
+
+        if sub == "SEARCH":
+            uids = mailbox.unseen_uids() if "UNSEEN" in rest.upper() else [
+                m.uid for m in mailbox.snapshot()
+            ]
+            self._send("* SEARCH" + "".join(f" {u}" for u in uids))
+            self._send(f"{tag} OK SEARCH completado")
+        elif sub == "FETCH":
+            uid_str = rest.split(" ", 1)[0]
+            stored = mailbox.get(int(uid_str)) if uid_str.isdigit() else None
+            if stored is not None:
+                self.wfile.write(
+                    f"* {stored.uid} FETCH (UID {stored.uid} RFC822 {{{len(stored.raw)}}}\r\n".encode()
+                )
+                self.wfile.write(stored.raw)
+                self._send(")")
+            self._send(f"{tag} OK FETCH completado")
+        elif sub == "STORE":
+            uid_str = rest.split(" ", 1)[0]
+            if uid_str.isdigit() and "\\SEEN" in rest.upper():
+                mailbox.mark_seen(int(uid_str))
+                self._send(f"* {uid_str} FETCH (UID {uid_str} FLAGS (\\Seen))")
+            self._send(f"{tag} OK STORE completado")
+        else:
+            self._send(f"{tag} BAD UID {sub} no soportado")
+
+
+class _IMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, addr, mailbox: Mailbox):
+        self.mailbox = mailbox
+        super().__init__(addr, _IMAPHandler)
+
+
+# =========================
+# SMTP
+# =========================
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    server: "_SMTPServer"
+    disable_nagle_algorithm = True
+
+    def _send(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self._send("220 fake-smtp ESMTP listo")
+        mail_from = ""
+        rcpts: List[str] = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            text = line.decode(errors="ignore").rstrip("\r\n")
+            verb = text.split(" ", 1)[0].upper()
+
+            if verb == "EHLO":
+                self._send("250-fake-smtp")
+                self._send("250-AUTH PLAIN LOGIN")
+                self._send("250 SIZE 52428800")
+            elif verb == "HELO":
+                self._send("250 fake-smtp")
+            elif verb == "AUTH":
+                # AUTH PLAIN <b64> en una línea; AUTH LOGIN pide usuario y clave
+                if text.upper().startswith("AUTH LOGIN"):
+                    self._send("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self._send("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                self._send("235 2.7.0 autenticado")
+            elif verb == "MAIL":
+                mail_from = text.split(":", 1)[1].strip(" <>") if ":" in text else ""
+                rcpts = []
+                self._send("250 OK")
+            elif verb == "RCPT":
+                rcpts.append(text.split(":", 1)[1].strip(" <>") if ":" in text else "")
+                self._send("250 OK")
+            elif verb == "DATA":
+                self._send("354 fin con <CRLF>.<CRLF>")
+                chunks = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    chunks.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                self.server.outbox.add(mail_from, rcpts, b"".join(chunks))
+                self._send("250 OK encolado")
+            elif verb in ("RSET", "NOOP"):
+                self._send("250 OK")
+            elif verb == "QUIT":
+                self._send("221 adiós")
+                return
+            else:
+                self._send(f"502 comando no soportado: {verb}")
+
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, addr, outbox: Outbox):
+        self.outbox = outbox
+        super().__init__(addr, _SMTPHandler)
+
+
+# =========================
+# Arranque / parada
+# =========================
+class FakeMailServers:
+    """
+    Levanta IMAP y SMTP en 127.0.0.1 con puertos efímeros.
+
+        with FakeMailServers() as servers:
+            servers.mailbox.append(raw_bytes)
+            servers.imap_port, servers.smtp_port
+    """
+
+    def __init__(self, host: str = "127.0.0.1"):
+        self.mailbox = Mailbox()
+        self.outbox = Outbox()
+        self._imap = _IMAPServer((host, 0), self.mailbox)
+        self._smtp = _SMTPServer((host, 0), self.outbox)
+        self.host = host
+        self.imap_port = self._imap.server_address[1]
+        self.smtp_port = self._smtp.server_address[1]
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "FakeMailServers":
+        for srv in (self._imap, self._smtp):
+            t = threading.Thread(target=srv.serve_forever, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self) -> None:
+        for srv in (self._imap, self._smtp):
+            srv.shutdown()
+            srv.server_close()
+
+    def __enter__(self) -> "FakeMailServers":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,515 @@
+# bench/throughput.py
+"""
+Benchmark end-to-end del worker: IMAP -> NLU -> BD -> SMTP -> \\Seen.
+
+Levanta IMAP/SMTP falsos en proceso (bench.fake_servers), los siembra con un
+corpus sintético (bench.corpus) y ejecuta el camino real de
+app.email.worker.poll_once()/process_email() sobre una BD SQLite temporal.
+El LLM se sustituye por un stub determinista (mismas reglas + latencia fija).
+
+Uso:
+    python -m bench.throughput --messages 500 --senders 50 --html-ratio 0.5
+    python -m bench.throughput --save-baseline          # guarda bench/baselines/default.json
+    python -m bench.throughput --check --threshold 0.2  # falla (exit 1) si hay regresión
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import email
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from email.header import decode_header, make_header
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bench.corpus import CorpusConfig, catalog, generate, parse_mix
+from bench.fake_servers import FakeMailServers
+
+BOT_ADDRESS = "biblioteca@bench.local"
+REPLY_SUBJECT = "Biblioteca — Respuesta"
+DEFAULT_BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+
+# =========================
+# Estadística
+# =========================
+def percentile(values: List[float], q: float) -> float:
+    """Percentil por rango más cercano (q en 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def summarize(values_s: List[float]) -> dict:
+    """Resumen en milisegundos de una lista de duraciones en segundos."""
+    ms = [v * 1000 for v in values_s]
+    return {
+        "count": len(ms),
+        "mean": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50": round(percentile(ms, 50), 3),
+        "p95": round(percentile(ms, 95), 3),
+        "p99": round(percentile(ms, 99), 3),
+        "max": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+# =========================
+# Instrumentación por etapa
+# =========================
+class StageTimer:
+    """
+    Envuelve las funciones que usa el worker (mismo módulo, mismos nombres) para
+    medir cuánto tarda cada etapa. No cambia su comportamiento.
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._local = threading.local()
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.samples[stage].append(seconds)
+
+    def timed(self, stage: str, fn):
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                dt = time.perf_counter() - t0
+                self.add(stage, dt)
+                self._local.nested = getattr(self._local, "nested", 0.0) + dt
+
+        return wrapper
+
+    def timed_process(self, fn):
+        """process_email: registra el tiempo de BD/servicios descontando la NLU."""
+
+        def wrapper(*args, **kwargs):
+            self._local.nested = 0.0
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add("service", time.perf_counter() - t0 - self._local.nested)
+
+        return wrapper
+
+    def timed_generator(self, stage: str, fn):
+        """fetch_unseen es un generador: se mide cada next() (SEARCH + FETCH)."""
+
+        def wrapper(*args, **kwargs):
+            it = iter(fn(*args, **kwargs))
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+                self.add(stage, time.perf_counter() - t0)
+                yield item
+
+        return wrapper
+
+    def report(self) -> dict:
+        return {stage: summarize(vals) for stage, vals in self.samples.items()}
+
+
+def instrument(worker, timer: StageTimer) -> None:
+    worker.fetch_unseen = timer.timed_generator("imap_fetch", worker.fetch_unseen)
+    worker.extract_intents = timer.timed("nlu", worker.extract_intents)
+    worker.process_email = timer.timed_process(worker.process_email)
+    worker.send_mail = timer.timed("smtp", worker.send_mail)
+    worker.mark_seen = timer.timed("imap_seen", worker.mark_seen)
+
+
+def install_llm_stub(latency_s: float) -> None:
+    """
+    Sustituye la llamada al LLM por una respuesta determinista (las reglas de
+    fallback) tras una espera fija, para simular el coste de red del modelo.
+    """
+    from app.nlu import intent_router
+
+    def _stub(system_prompt: str, text: str):
+        if latency_s > 0:
+            time.sleep(latency_s)
+        return [dict(op) for op in intent_router._rules_intents(text, None)]
+
+    intent_router._llm_intents = _stub
+
+
+# =========================
+# Ejecución
+# =========================
+def _configure_env(servers: FakeMailServers, db_path: str, use_llm: bool, limits: dict) -> None:
+    # Debe ocurrir ANTES de importar app.*: la config se lee al importar
+    os.environ.update(limits)
+    os.environ.update(
+        {
+            "DATABASE_URL": f"sqlite:///{db_path}",
+            "EMAIL_ADDRESS": BOT_ADDRESS,
+            "EMAIL_APP_PASSWORD": "bench",
+            "IMAP_HOST": servers.host,
+            "IMAP_PORT": str(servers.imap_port),
+            "IMAP_SSL": "false",
+            "SMTP_HOST": servers.host,
+            "SMTP_PORT": str(servers.smtp_port),
+            "SMTP_STARTTLS": "false",
+            "CC_ME": "",
+            "ALLOWED_SENDERS": "",
+            "POLL_SECONDS": "0",
+            "USE_LLM": "true" if use_llm else "false",
+        }
+    )
+
+
+def _seed_catalog(size: int, copies: int) -> None:
+    from app.db import SessionLocal, engine
+    from app.services import init_db, register_book
+
+    init_db(engine)
+    db = SessionLocal()
+    try:
+        for isbn, title in catalog(size):
+            register_book(db, title=title, author="Bench", isbn=isbn, copies=copies)
+    finally:
+        db.close()
+
+
+def _subject(raw: bytes) -> str:
+    msg = email.message_from_bytes(raw)
+    return str(make_header(decode_header(msg.get("Subject", ""))))
+
+
+def _feed(servers: FakeMailServers, flood, mails, rate: float, done: threading.Event) -> None:
+    """
+    Entrega los correos al INBOX: primero la inundación (de golpe) y luego el
+    resto, todos de golpe (rate=0) o a ritmo constante.
+    """
+    for mail in flood:
+        servers.mailbox.append(mail.raw, sender=mail.sender)
+    start = time.perf_counter()
+    for i, mail in enumerate(mails):
+        if rate > 0:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        servers.mailbox.append(mail.raw, sender=mail.sender)
+    done.set()
+
+
+def run_benchmark(
+    cfg: CorpusConfig,
+    *,
+    rate: float = 0.0,
+    llm_latency_ms: float = 50.0,
+    use_llm: bool = True,
+    poll_interval: float = 0.05,
+    timeout: float = 600.0,
+    verbose: bool = False,
+    flood_messages: int = 0,
+    flood_mix: Optional[Dict[str, float]] = None,
+    sender_rate_per_min: float = 0.0,
+    sender_burst: int = 5,
+    sender_max_queue: int = 20,
+    fifo: bool = False,
+) -> dict:
+    """
+    flood_messages > 0 añade un único remitente (flood0000@bench.local) que
+    deja todos sus correos en el INBOX al inicio; la latencia principal se
+    mide solo sobre los remitentes normales.
+    Los límites por remitente van desactivados por defecto (sender_rate_per_min=0)
+    para que el throughput base no dependa de ellos.
+    """
+    mails = generate(cfg, BOT_ADDRESS)
+    flood = []
+    if flood_messages > 0:
+        flood = generate(
+            CorpusConfig(
+                messages=flood_messages,
+                senders=1,
+                html_ratio=cfg.html_ratio,
+                body_bytes=cfg.body_bytes,
+                catalog_size=cfg.catalog_size,
+                mix=flood_mix or {"reserve": 1.0},
+                sender_prefix="flood",
+                seed=cfg.seed + 1,
+            ),
+            BOT_ADDRESS,
+        )
+    flood_senders = {m.sender for m in flood}
+    limits = {
+        "SENDER_RATE_PER_MIN": str(sender_rate_per_min),
+        "SENDER_BURST": str(sender_burst),
+        "SENDER_MAX_QUEUE": str(sender_max_queue),
+        "RATE_LIMIT_EXEMPT": "",
+        "FAIR_SCHEDULING": "false" if fifo else "true",
+    }
+
+    with tempfile.TemporaryDirectory(prefix="biblio-bench-") as tmp, FakeMailServers() as servers:
+        _configure_env(servers, os.path.join(tmp, "bench.db"), use_llm, limits)
+
+        from app.email import worker
+        from app.email.scheduler import FairScheduler
+
+        _seed_catalog(cfg.catalog_size, copies=max(cfg.messages + flood_messages, 1))
+        install_llm_stub(llm_latency_ms / 1000)
+        timer = StageTimer()
+        instrument(worker, timer)
+
+        fed = threading.Event()
+        feeder = threading.Thread(target=_feed, args=(servers, flood, mails, rate, fed), daemon=True)
+        scheduler = FairScheduler()
+
+        timed_out = False
+        with contextlib.ExitStack() as stack:
+            if not verbose:
+                sink = stack.enter_context(open(os.devnull, "w"))
+                stack.enter_context(contextlib.redirect_stdout(sink))
+            client = worker.connect_imap()
+            t_start = time.perf_counter()
+            feeder.start()
+            while True:
+                worker.poll_once(client, scheduler)
+                # La inundación limitada puede seguir en cola: solo esperamos a los normales
+                pending = [
+                    m for m in servers.mailbox.snapshot()
+                    if m.seen_at is None and m.sender not in flood_senders
+                ]
+                if fed.is_set() and not pending:
+                    break
+                if time.perf_counter() - t_start > timeout:
+                    timed_out = True
+                    break
+                if poll_interval > 0 and not scheduler.has_ready():
+                    time.sleep(poll_interval)
+            t_end = time.perf_counter()
+            client.logout()
+
+        stored = servers.mailbox.snapshot()
+        done = [m for m in stored if m.seen_at is not None and m.sender not in flood_senders]
+        elapsed = t_end - t_start
+        latencies = [m.seen_at - m.appended_at for m in done]
+        flood_done = [m for m in stored if m.seen_at is not None and m.sender in flood_senders]
+        with servers.outbox.lock:
+            flood_subjects = [_subject(r["data"]) for r in servers.outbox.sent if set(r["to"]) & flood_senders]
+        flood_answered = sum(1 for subj in flood_subjects if subj == REPLY_SUBJECT)
+
+        return {
+            "config": {
+                "messages": cfg.messages,
+                "senders": cfg.senders,
+                "html_ratio": cfg.html_ratio,
+                "body_bytes": cfg.body_bytes,
+                "catalog_size": cfg.catalog_size,
+                "mix": cfg.mix,
+                "ops_per_mail": cfg.ops_per_mail,
+                "seed": cfg.seed,
+                "rate": rate,
+                "use_llm": use_llm,
+                "llm_latency_ms": llm_latency_ms,
+                "flood_messages": flood_messages,
+                "sender_rate_per_min": sender_rate_per_min,
+                "sender_burst": sender_burst,
+                "sender_max_queue": sender_max_queue,
+                "fifo": fifo,
+            },
+            "processed": len(done),
+            "replies": len(servers.outbox),
+            "timed_out": timed_out,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_msgs_per_s": round(len(done) / elapsed, 3) if elapsed > 0 else 0.0,
+            "throughput_msgs_per_min": round(len(done) / elapsed * 60, 1) if elapsed > 0 else 0.0,
+            "latency_ms": summarize(latencies),
+            "stages_ms": timer.report(),
+            "flood": {
+                "messages": flood_messages,
+                # Respondidos vs marcados leídos sin respuesta (descartados)
+                "processed": flood_answered,
+                "dropped": max(0, len(flood_done) - flood_answered),
+                "pending": flood_messages - len(flood_done),
+                "notices": len(flood_subjects) - flood_answered,
+                "latency_ms": summarize([m.seen_at - m.appended_at for m in flood_done]),
+            },
+        }
+
+
+# =========================
+# Baselines
+# =========================
+def config_mismatch(report: dict, baseline: dict) -> List[str]:
+    """Claves de config que difieren: con config distinta la comparación no tiene sentido."""
+    cur = report.get("config", {})
+    base = baseline.get("config", {})
+    return [
+        f"{key}: actual={cur.get(key)!r} baseline={base.get(key)!r}"
+        for key in sorted(set(cur) | set(base))
+        if cur.get(key) != base.get(key)
+    ]
+
+
+def incomplete_run(report: dict) -> List[str]:
+    """Motivos por los que un reporte no sirve como baseline (vacía = sirve)."""
+    problems: List[str] = []
+    if report.get("timed_out"):
+        problems.append("la ejecución superó el timeout")
+    if report["processed"] < report["config"]["messages"]:
+        problems.append(
+            f"solo {report['processed']}/{report['config']['messages']} correos procesados"
+        )
+    return problems
+
+
+def check_regression(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Compara contra un baseline. Devuelve la lista de regresiones (vacía = OK):
+      - throughput por debajo de baseline * (1 - threshold)
+      - p95/p99 de latencia por encima de baseline * (1 + threshold)
+      - ejecución incompleta (ver incomplete_run)
+    """
+    problems: List[str] = []
+    base_tp = baseline.get("throughput_msgs_per_s", 0.0)
+    tp = report["throughput_msgs_per_s"]
+    if base_tp and tp < base_tp * (1 - threshold):
+        problems.append(f"throughput {tp:.2f} msg/s < baseline {base_tp:.2f} msg/s")
+    for key in ("p95", "p99"):
+        base_lat = baseline.get("latency_ms", {}).get(key, 0.0)
+        lat = report["latency_ms"][key]
+        if base_lat and lat > base_lat * (1 + threshold):
+            problems.append(f"latencia {key} {lat:.1f} ms > baseline {base_lat:.1f} ms")
+    problems.extend(incomplete_run(report))
+    return problems
+
+
+def format_report(report: dict) -> str:
+    lat = report["latency_ms"]
+    lines = [
+        f"Procesados: {report['processed']}/{report['config']['messages']} "
+        f"(respuestas SMTP: {report['replies']}) en {report['elapsed_s']:.2f}s",
+        f"Throughput: {report['throughput_msgs_per_s']:.2f} msg/s "
+        f"({report['throughput_msgs_per_min']:.0f} msg/min)",
+        f"Latencia e2e (ms): p50={lat['p50']:.1f} p95={lat['p95']:.1f} "
+        f"p99={lat['p99']:.1f} max={lat['max']:.1f}",
+        "Etapas (ms):",
+    ]
+    flood = report.get("flood") or {}
+    if flood.get("messages"):
+        fl = flood["latency_ms"]
+        lines[3:3] = [
+            f"Inundación: {flood['messages']} correos: {flood['processed']} procesados, "
+            f"{flood['dropped']} descartados, {flood['pending']} en espera "
+            f"(avisos: {flood['notices']}); latencia p50={fl['p50']:.1f} p95={fl['p95']:.1f} ms",
+        ]
+    for stage, s in report["stages_ms"].items():
+        lines.append(
+            f"  {stage:<11} n={s['count']:<6} mean={s['mean']:<9.3f} "
+            f"p50={s['p50']:<9.3f} p95={s['p95']:<9.3f} p99={s['p99']:.3f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark end-to-end del worker de correo")
+    p.add_argument("--messages", type=int, default=200)
+    p.add_argument("--senders", type=int, default=20)
+    p.add_argument("--html-ratio", type=float, default=0.3)
+    p.add_argument("--body-bytes", type=int, default=512)
+    p.add_argument("--catalog-size", type=int, default=50)
+    p.add_argument("--mix", type=str, default="", help="ej: reserve=3,renew=1,list_books=2")
+    p.add_argument("--ops-per-mail", type=int, default=1, help="operaciones (ISBN) por correo")
+    p.add_argument("--seed", type=int, default=1234)
+    p.add_argument("--rate", type=float, default=0.0, help="correos/s entrantes (0 = todos al inicio)")
+    p.add_argument("--llm-latency-ms", type=float, default=50.0)
+    p.add_argument("--no-llm", action="store_true", help="solo reglas (USE_LLM=false)")
+    p.add_argument("--flood-messages", type=int, default=0, help="correos de un único remitente abusivo")
+    p.add_argument("--flood-mix", type=str, default="", help="mezcla de acciones de la inundación")
+    p.add_argument("--sender-rate-per-min", type=float, default=0.0, help="límite por remitente (0 = sin límite)")
+    p.add_argument("--sender-burst", type=int, default=5)
+    p.add_argument("--sender-max-queue", type=int, default=20)
+    p.add_argument("--fifo", action="store_true", help="orden de UID en vez de round-robin")
+    p.add_argument("--poll-interval", type=float, default=0.05)
+    p.add_argument("--timeout", type=float, default=600.0)
+    p.add_argument("--verbose", action="store_true", help="muestra los logs del worker")
+    p.add_argument("--json", type=str, default="", help="guarda el reporte en este archivo")
+    p.add_argument("--name", type=str, default="default", help="nombre del baseline")
+    p.add_argument("--baseline-dir", type=str, default=str(DEFAULT_BASELINE_DIR))
+    p.add_argument("--save-baseline", action="store_true")
+    p.add_argument("--check", action="store_true", help="compara contra el baseline guardado")
+    p.add_argument("--threshold", type=float, default=0.2, help="tolerancia relativa (0.2 = 20%%)")
+    args = p.parse_args(argv)
+
+    cfg = CorpusConfig(
+        messages=args.messages,
+        senders=args.senders,
+        html_ratio=args.html_ratio,
+        body_bytes=args.body_bytes,
+        catalog_size=args.catalog_size,
+        ops_per_mail=args.ops_per_mail,
+        seed=args.seed,
+    )
+    if args.mix:
+        cfg.mix = parse_mix(args.mix)
+
+    report = run_benchmark(
+        cfg,
+        rate=args.rate,
+        llm_latency_ms=args.llm_latency_ms,
+        use_llm=not args.no_llm,
+        poll_interval=args.poll_interval,
+        timeout=args.timeout,
+        verbose=args.verbose,
+        flood_messages=args.flood_messages,
+        flood_mix=parse_mix(args.flood_mix) if args.flood_mix else None,
+        sender_rate_per_min=args.sender_rate_per_min,
+        sender_burst=args.sender_burst,
+        sender_max_queue=args.sender_max_queue,
+        fifo=args.fifo,
+    )
+    print(format_report(report))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    baseline_path = Path(args.baseline_dir) / f"{args.name}.json"
+    if args.save_baseline:
+        incomplete = incomplete_run(report)
+        if incomplete:
+            print(f"No se guarda el baseline en {baseline_path}:", file=sys.stderr)
+            for prob in incomplete:
+                print(f"  - {prob}", file=sys.stderr)
+            return 2
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Baseline guardado en {baseline_path}")
+
+    if args.check:
+        if not baseline_path.exists():
+            print(f"No existe baseline en {baseline_path} (usa --save-baseline)", file=sys.stderr)
+            return 2
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        mismatch = config_mismatch(report, baseline)
+        if mismatch:
+            print(f"La config no coincide con el baseline {baseline_path}; no se compara:", file=sys.stderr)
+            for diff in mismatch:
+                print(f"  - {diff}", file=sys.stderr)
+            return 2
+        problems = check_regression(report, baseline, args.threshold)
+        if problems:
+            print("REGRESIÓN:", file=sys.stderr)
+            for prob in problems:
+                print(f"  - {prob}", file=sys.stderr)
+            return 1
+        print(f"Sin regresiones (tolerancia {args.threshold:.0%}) frente a {baseline_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
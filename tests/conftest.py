@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+# La config de app.* se lee al importar: BD temporal y sin LLM antes de cualquier import
+_tmp = tempfile.mkdtemp(prefix="biblio-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["USE_LLM"] = "false"
+
+import pytest  # noqa: E402
+
+from app import models  # noqa: E402
+from app.db import SessionLocal, engine  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,60 @@
+import pytest
+
+from bench.throughput import check_regression, config_mismatch, incomplete_run, main, percentile
+
+
+def _report(tp=10.0, p95=100.0, p99=200.0, processed=100, timed_out=False, **config):
+    return {
+        "config": {"messages": 100, "seed": 1, **config},
+        "processed": processed,
+        "timed_out": timed_out,
+        "throughput_msgs_per_s": tp,
+        "latency_ms": {"p95": p95, "p99": p99},
+    }
+
+
+@pytest.mark.parametrize(
+    ("values", "q", "expected"),
+    [
+        (list(range(1, 101)), 95, 95),
+        (list(range(1, 101)), 99, 99),
+        (list(range(1, 101)), 100, 100),
+        (list(range(1, 21)), 95, 19),
+        (list(range(1, 21)), 50, 10),
+        ([7.0], 99, 7.0),
+        ([], 95, 0.0),
+    ],
+)
+def test_percentile_nearest_rank(values, q, expected):
+    assert percentile(values, q) == expected
+
+
+def test_config_mismatch_lists_differing_keys():
+    assert config_mismatch(_report(), _report()) == []
+    assert config_mismatch(_report(rate=5), _report(seed=2)) == [
+        "rate: actual=5 baseline=None",
+        "seed: actual=1 baseline=2",
+    ]
+
+
+def test_check_regression_threshold_is_relative():
+    base = _report()
+    assert check_regression(_report(tp=8.0, p95=120.0, p99=240.0), base, 0.2) == []
+    problems = check_regression(_report(tp=7.9, p95=120.1, p99=240.0), base, 0.2)
+    assert len(problems) == 2
+    assert problems[0].startswith("throughput")
+    assert problems[1].startswith("latencia p95")
+
+
+def test_incomplete_run_is_a_regression():
+    assert incomplete_run(_report()) == []
+    assert len(incomplete_run(_report(processed=99, timed_out=True))) == 2
+    assert check_regression(_report(processed=99), _report(), 0.2) == ["solo 99/100 correos procesados"]
+
+
+def test_save_baseline_refuses_incomplete_run(tmp_path, monkeypatch):
+    monkeypatch.setattr("bench.throughput.run_benchmark", lambda cfg, **kw: _report(processed=50))
+    monkeypatch.setattr("bench.throughput.format_report", lambda report: "")
+
+    assert main(["--save-baseline", "--baseline-dir", str(tmp_path)]) == 2
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,105 @@
+import pytest
+
+from app.nlu import intent_router
+from app.nlu.intent_router import _fallback_rules, _rules_intents, extract_intents, is_cheap_request
+
+
+def _ops(text):
+    return [(op["action"], op["isbn"], op["title"]) for op in _rules_intents(text, "ana@x.com")]
+
+
+def test_single_isbn_matches_fallback_rules():
+    text = "Reservar libro\nQuiero reservar isbn:9780307474728"
+    assert _rules_intents(text, "ana@x.com") == [_fallback_rules(text, "ana@x.com")]
+
+
+def test_one_operation_per_line_and_isbn():
+    text = (
+        "Registrar libros\n"
+        '"Cien años" isbn:9780307474728\n'
+        '"El Quijote" isbn:978-84-9105-029-9\n'
+    )
+    assert _ops(text) == [
+        ("register_book", "9780307474728", "Cien años"),
+        ("register_book", "9788491050299", "El Quijote"),
+    ]
+
+
+def test_line_keyword_overrides_email_action_and_duplicates_collapse():
+    text = "Renovar\n9780307474728, 9788491050299\n9780307474728\ncancelar isbn:9780000000002"
+    assert _ops(text) == [
+        ("renew", "9780307474728", None),
+        ("renew", "9788491050299", None),
+        ("cancel_reservation", "9780000000002", None),
+    ]
+
+
+def test_quoted_reply_lines_are_ignored():
+    text = (
+        "Re: reservar\n"
+        "reservar el primero\n"
+        "> Aquí va. Catálogo:\n"
+        "> - A (ISBN 9780000000001) | disp: 1/1\n"
+        "> - B (ISBN 9780000000002) | disp: 1/1\n"
+        "> - C (ISBN 9780000000003) | disp: 1/1\n"
+    )
+    assert len(_rules_intents(text, "ana@x.com")) == 1
+
+
+def test_unquoted_reply_stops_at_quote_marker():
+    text = (
+        "Re: Biblioteca — Respuesta\n"
+        "Quiero reservar isbn:9780000000001\n"
+        "\n"
+        "El lun, 3 jun 2024 a las 10:00, Biblioteca <biblio@x.com> escribió:\n"
+        "Tu solicitud: list_books sobre (sin título/ISBN).\n"
+        "Aquí va. Catálogo:\n"
+        "- A (ISBN 9780000000001) | disp: 1/1\n"
+        "- B (ISBN 9780000000002) | disp: 1/1\n"
+        "- C (ISBN 9780000000003) | disp: 1/1\n"
+        "¿Te ayudo con algo más? Puedes escribir: reservar, renovar, cancelar, registrar, eliminar, lista.\n"
+    )
+    assert _ops(text) == [("reserve", "9780000000001", None)]
+
+
+@pytest.mark.parametrize(
+    "marker",
+    ["De: Biblioteca <biblio@x.com>", "-----Original Message-----", "-- ", "Tu solicitud: reserve sobre X."],
+)
+def test_reply_and_signature_markers_end_own_text(marker):
+    text = f"Reservar\nisbn:9780000000001\n{marker}\nisbn:9780000000002\nisbn:9780000000003"
+    assert _ops(text) == [("reserve", "9780000000001", None)]
+
+
+def test_bare_numbers_that_are_not_isbns_are_ignored():
+    text = "Reservar\nQuiero reservar isbn:9780307474728\n--\nAna\ntel 600-123-4567"
+    assert _rules_intents(text, "ana@x.com") == [_fallback_rules(text, "ana@x.com")]
+
+
+def test_bare_isbn10_with_valid_checksum_counts():
+    assert _ops("Reservar\n0306406152\n9780307474728") == [
+        ("reserve", "0306406152", None),
+        ("reserve", "9780307474728", None),
+    ]
+
+
+def test_list_request_is_single_operation():
+    assert _ops("Lista de libros\n9780307474728\n9788491050299") == [("list_books", "9780307474728", None)]
+
+
+def test_list_keyword_is_only_a_scheduling_hint(monkeypatch):
+    monkeypatch.setenv("USE_LLM", "true")
+    seen = []
+
+    def fake_llm(system_prompt, text):
+        seen.append(text)
+        return [{"action": "reserve", "title": "Rayuela"}]
+
+    monkeypatch.setattr(intent_router, "_llm_intents", fake_llm)
+    text = "Quiero apartar 'Rayuela', vi la lista"
+
+    assert is_cheap_request(text)
+    assert extract_intents(text, "ana@x.com") == [
+        {"action": "reserve", "title": "Rayuela", "user_email": "ana@x.com"}
+    ]
+    assert seen == [text]
@@ -0,0 +1,166 @@
+import pytest
+
+from app.email.scheduler import NOTICE_MAX_ATTEMPTS, FairScheduler, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def _scheduler(clock, **kwargs):
+    opts = {"rate_per_min": 60, "burst": 2, "max_queue": 0, "exempt": set(), "fair": True}
+    opts.update(kwargs)
+    return FairScheduler(clock=clock, **opts)
+
+
+def _drain(scheduler):
+    """Todas las vueltas del round-robin hasta vaciar lo que tenga token."""
+    out = []
+    while True:
+        batch = [uid for uid, _ in scheduler.ready()]
+        if not batch:
+            return out
+        out.extend(batch)
+
+
+def test_token_bucket_burst_and_refill():
+    bucket = TokenBucket(rate_per_min=60, burst=2, now=0.0)
+    assert bucket.try_take(0.0)
+    assert bucket.try_take(0.0)
+    assert not bucket.try_take(0.5)
+    assert bucket.try_take(1.0)
+    assert bucket.is_full(10.0)
+
+
+def test_round_robin_across_senders(clock):
+    s = _scheduler(clock, rate_per_min=0)
+    for uid in (1, 2, 3):
+        s.add(uid, None, sender="flood@x.com", cheap=False)
+    s.add(4, None, sender="ana@x.com", cheap=False)
+    assert _drain(s)[:2] == [1, 4]
+
+
+def test_one_turn_per_sender_per_cycle(clock):
+    s = _scheduler(clock, rate_per_min=0)
+    for uid in (1, 2, 3):
+        s.add(uid, None, sender="flood@x.com", cheap=False)
+    s.add(4, None, sender="ana@x.com", cheap=False)
+
+    assert [uid for uid, _ in s.ready()] == [1, 4]
+    assert s.has_ready()
+    # Lo que llega entre vueltas compite de igual a igual con la inundación
+    s.add(5, None, sender="bob@x.com", cheap=False)
+    assert [uid for uid, _ in s.ready()] == [2, 5]
+
+
+def test_fifo_mode_drains_in_uid_order(clock):
+    s = _scheduler(clock, rate_per_min=0, fair=False)
+    for uid, sender in ((1, "a"), (2, "a"), (3, "b"), (4, "a")):
+        s.add(uid, None, sender=sender, cheap=uid == 4)
+    assert [uid for uid, _ in s.ready()] == [1, 2, 3, 4]
+
+
+def test_has_ready_waits_for_tokens(clock):
+    s = _scheduler(clock, burst=1, rate_per_min=60)
+    s.add(1, None, sender="ana@x.com", cheap=False)
+    s.add(2, None, sender="ana@x.com", cheap=False)
+    assert _drain(s) == [1]
+    assert not s.has_ready()
+    clock.now += 1.0
+    assert s.has_ready()
+
+
+def test_rule_path_goes_first(clock):
+    s = _scheduler(clock, rate_per_min=0)
+    s.add(1, None, sender="ana@x.com", cheap=False)
+    s.add(2, None, sender="bob@x.com", cheap=True)
+    assert _drain(s)[0] == 2
+
+
+def test_over_queue_mail_is_deferred_not_dropped(clock):
+    s = _scheduler(clock, max_queue=2)
+    for uid in (1, 2, 3, 4, 5):
+        s.add(uid, None, sender="flood@x.com", cheap=False)
+    assert s.pending_uids() == {1, 2, 3, 4, 5}
+
+    assert _drain(s) == [1, 2]
+    [t] = s.take_throttled()
+    assert (t.sender, t.pending) == ("flood@x.com", 3)
+
+    # Con la cola vacía se liberan dos aplazados: el próximo fetch los vuelve a bajar
+    assert s.pending_uids() == {5}
+    s.add(6, None, sender="flood@x.com", cheap=False)  # más nuevo: detrás de los aplazados
+    s.add(3, None, sender="flood@x.com", cheap=False)
+    s.add(4, None, sender="flood@x.com", cheap=False)
+    clock.now += 2.0
+    assert _drain(s) == [3, 4]
+    s.take_throttled()
+    assert s.pending_uids() == set()
+
+
+def test_uid_is_charged_only_once(clock):
+    s = _scheduler(clock, burst=1, rate_per_min=1)
+    s.add(1, None, sender="ana@x.com", cheap=False)
+    assert _drain(s) == [1]
+
+    # Sigue UNSEEN (ej: fallo SMTP): vuelve a entrar sin pagar otro token
+    s.add(1, None, sender="ana@x.com", cheap=False)
+    assert _drain(s) == [1]
+    assert s.take_throttled() == []
+
+    s.done(1)
+    s.add(2, None, sender="ana@x.com", cheap=False)
+    assert _drain(s) == []
+    assert [t.sender for t in s.take_throttled()] == ["ana@x.com"]
+
+
+def test_exempt_sender_is_not_limited(clock):
+    s = _scheduler(clock, burst=1, exempt={"biblio@x.com"})
+    for uid in (1, 2, 3):
+        s.add(uid, None, sender="biblio@x.com", cheap=False)
+    assert sorted(_drain(s)) == [1, 2, 3]
+
+
+def test_notice_repeats_until_confirmed(clock):
+    s = _scheduler(clock, burst=1, rate_per_min=1)
+    for uid in (1, 2, 3):
+        s.add(uid, None, sender="ana@x.com", cheap=False)
+    _drain(s)
+    assert [t.notify for t in s.take_throttled()] == [True]
+
+    # El envío falló: sigue pendiente de aviso
+    _drain(s)
+    assert [t.notify for t in s.take_throttled()] == [True]
+
+    s.mark_notified("ana@x.com")
+    _drain(s)
+    assert [t.notify for t in s.take_throttled()] == [False]
+
+
+def test_failing_notice_gives_up_until_episode_ends(clock):
+    s = _scheduler(clock, burst=1, rate_per_min=1)
+    for uid in (1, 2):
+        s.add(uid, None, sender="spoof@x.com", cheap=False)
+    notices = []
+    for _ in range(NOTICE_MAX_ATTEMPTS + 3):
+        _drain(s)
+        notices += [t.notify for t in s.take_throttled()]
+    assert notices.count(True) == NOTICE_MAX_ATTEMPTS
+
+    # Cola vacía: termina el episodio y un nuevo exceso vuelve a avisar
+    clock.now += 120
+    _drain(s)
+    s.take_throttled()
+    s.add(3, None, sender="spoof@x.com", cheap=False)
+    s.add(4, None, sender="spoof@x.com", cheap=False)
+    _drain(s)
+    assert [t.notify for t in s.take_throttled()] == [True]
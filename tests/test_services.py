@@ -0,0 +1,102 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app import models
+from app.db import engine
+from app.services import register_book, reserve_book, run_batch
+
+
+@pytest.fixture
+def statements():
+    """SQL real que llega a SQLite (incluye BEGIN/SAVEPOINT/RELEASE/COMMIT)."""
+    seen = []
+
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.set_trace_callback(seen.append)
+
+    engine.dispose()
+    event.listen(engine, "connect", on_connect)
+    yield seen
+    event.remove(engine, "connect", on_connect)
+    engine.dispose()
+
+
+def _visible_isbns():
+    """Lo que ve OTRA conexión (sin pasar por SQLAlchemy)."""
+    con = sqlite3.connect(engine.url.database)
+    try:
+        return {row[0] for row in con.execute("SELECT isbn FROM books")}
+    finally:
+        con.close()
+
+
+def _register(isbn, title="T"):
+    def op(db):
+        return register_book(db, title=title, author="A", isbn=isbn, commit=False)
+    return op
+
+
+def test_run_batch_single_commit(db, statements):
+    seen_mid_batch = []
+
+    def peek(db):
+        seen_mid_batch.append(_visible_isbns())
+
+    run_batch(db, [_register("9780000000011"), _register("9780000000012"), peek, _register("9780000000013")])
+
+    assert seen_mid_batch == [set()]
+    assert _visible_isbns() == {"9780000000011", "9780000000012", "9780000000013"}
+    assert sum(1 for s in statements if s.strip().upper() == "COMMIT") == 1
+    assert sum(1 for s in statements if s.strip().upper().startswith("BEGIN")) == 1
+
+
+def test_run_batch_failed_item_only_rolls_back_itself(db):
+    def boom(db):
+        db.add(models.Book(title="X", author="A", isbn="9780000000099"))
+        db.flush()
+        raise ValueError("fallo")
+
+    results = run_batch(db, [_register("9780000000021"), boom, _register("9780000000021"), _register("9780000000022")])
+
+    assert results[0][1] is None
+    assert results[1] == (None, "Algún dato de la solicitud no es válido.")
+    assert results[2][0] == (None, "El ISBN ya existe en el catálogo.")
+    assert results[3][1] is None
+    assert _visible_isbns() == {"9780000000021", "9780000000022"}
+
+
+def test_run_batch_integrity_error_does_not_leak_sql(db):
+    def duplicate(db):
+        db.add(models.Book(title="X", author="A", isbn="9780000000041"))
+        db.add(models.Book(title="Y", author="A", isbn="9780000000041"))
+        db.flush()
+
+    [(res, err)] = run_batch(db, [duplicate])
+
+    assert res is None
+    assert err == "Los datos entran en conflicto con el catálogo (ej: ISBN duplicado)."
+    assert _visible_isbns() == set()
+
+
+def test_run_batch_reraises_db_errors(db):
+    def locked(db):
+        raise OperationalError("UPDATE books", {}, Exception("database is locked"))
+
+    with pytest.raises(OperationalError):
+        run_batch(db, [_register("9780000000031"), locked])
+    assert _visible_isbns() == set()
+
+
+def test_reserve_twice_in_batch_sees_pending_reservation(db):
+    register_book(db, title="T", author="A", isbn="9780000000041", copies=5)
+
+    def reserve(db):
+        return reserve_book(db, user_email="ana@x.com", isbn="9780000000041", commit=False)
+
+    results = run_batch(db, [reserve, reserve])
+
+    assert results[0][0][1] is None
+    assert results[1][0] == (None, "Ya tienes una reserva activa de este libro")
@@ -0,0 +1,152 @@
+import email
+from email.message import EmailMessage
+
+import pytest
+
+from app.email import worker
+from app.email.scheduler import FairScheduler
+
+
+def _mail(sender, subject, body="hola"):
+    msg = EmailMessage()
+    msg["From"] = f"Lector <{sender}>"
+    msg["Subject"] = subject
+    msg.set_content(body)
+    return msg
+
+
+class Inbox:
+    """Sustituye a fetch_unseen/mark_seen/send_mail del worker."""
+
+    def __init__(self, monkeypatch, smtp_result=None):
+        self.unseen = {}
+        self.sent = []
+        self.smtp_result = smtp_result or {}
+        monkeypatch.setattr(worker, "fetch_unseen", self.fetch_unseen)
+        monkeypatch.setattr(worker, "mark_seen", self.mark_seen)
+        monkeypatch.setattr(worker, "send_mail", self.send_mail)
+
+    def fetch_unseen(self, client, skip_uids=None):
+        for uid, msg in sorted(self.unseen.items()):
+            if uid not in (skip_uids or set()):
+                yield uid, msg
+
+    def mark_seen(self, client, uid):
+        self.unseen.pop(uid, None)
+
+    def send_mail(self, to_addr, subject, body):
+        self.sent.append((to_addr, subject))
+        return self.smtp_result
+
+
+@pytest.fixture
+def scheduler():
+    now = [0.0]
+    s = FairScheduler(rate_per_min=10, burst=1, max_queue=20, exempt=set(), fair=True, clock=lambda: now[0])
+    s.now = now
+    return s
+
+
+def test_mail_without_action_does_not_spend_tokens(db, monkeypatch, scheduler):
+    inbox = Inbox(monkeypatch)
+    for uid in (1, 2, 3):
+        inbox.unseen[uid] = _mail("ana@x.com", "hola, ¿qué tal?")
+    inbox.unseen[4] = _mail("ana@x.com", "Lista de libros")
+
+    for _ in range(8):
+        worker.poll_once(None, scheduler)
+
+    assert 4 not in inbox.unseen
+    assert inbox.sent == [("ana@x.com", "Biblioteca — Respuesta")]
+
+
+def test_failed_send_is_retried_without_new_charge_or_notice(db, monkeypatch, scheduler):
+    inbox = Inbox(monkeypatch, smtp_result={"ana@x.com": (450, b"try later")})
+    inbox.unseen[1] = _mail("ana@x.com", "Lista de libros")
+
+    for _ in range(5):
+        worker.poll_once(None, scheduler)
+
+    assert [subject for _, subject in inbox.sent] == ["Biblioteca — Respuesta"] * 5
+    assert 1 in inbox.unseen
+
+
+def test_priority_uses_subject_and_body(db, monkeypatch, scheduler):
+    monkeypatch.setenv("USE_LLM", "true")
+    inbox = Inbox(monkeypatch)
+    inbox.unseen[1] = _mail("ana@x.com", "Lista de libros", "quiero reservar isbn:9780307474728")
+    added = []
+    monkeypatch.setattr(scheduler, "add", lambda uid, msg, **kw: added.append(kw["cheap"]))
+
+    worker.poll_once(None, scheduler)
+
+    assert added == [False]
+
+
+def test_over_queue_mail_stays_unseen_and_is_answered_later(db, monkeypatch):
+    now = [0.0]
+    s = FairScheduler(rate_per_min=60, burst=1, max_queue=1, exempt=set(), fair=True, clock=lambda: now[0])
+    inbox = Inbox(monkeypatch)
+    for uid in (1, 2, 3):
+        inbox.unseen[uid] = _mail("ana@x.com", "Lista de libros")
+
+    worker.poll_once(None, s)
+    assert set(inbox.unseen) == {2, 3}
+    assert [subject for _, subject in inbox.sent] == ["Biblioteca — Respuesta", "Biblioteca — Demasiadas solicitudes"]
+
+    for _ in range(6):
+        now[0] += 1.0
+        worker.poll_once(None, s)
+
+    assert set(inbox.unseen) == set()
+    assert [subject for _, subject in inbox.sent].count("Biblioteca — Respuesta") == 3
+    assert [subject for _, subject in inbox.sent].count("Biblioteca — Demasiadas solicitudes") == 1
+
+
+def test_failed_notice_is_retried(db, monkeypatch):
+    s = FairScheduler(rate_per_min=1, burst=1, max_queue=1, exempt=set(), fair=True, clock=lambda: 0.0)
+    inbox = Inbox(monkeypatch)
+    calls = []
+
+    def failing_send(to_addr, subject, body):
+        calls.append(subject)
+        if subject.startswith("Biblioteca — Demasiadas"):
+            raise OSError("smtp caído")
+        return {}
+
+    monkeypatch.setattr(worker, "send_mail", failing_send)
+    for uid in (1, 2, 3):
+        inbox.unseen[uid] = _mail("ana@x.com", "Lista de libros")
+
+    worker.poll_once(None, s)
+    worker.poll_once(None, s)
+
+    assert set(inbox.unseen) == {2, 3}
+    assert calls.count("Biblioteca — Demasiadas solicitudes") == 2
+
+
+def test_undecodable_header_does_not_block_other_mail(db, monkeypatch, scheduler):
+    inbox = Inbox(monkeypatch)
+    # Igual que fetch_unseen: message_from_bytes deja el encabezado sin decodificar
+    inbox.unseen[1] = email.message_from_bytes(
+        b"From: Ana <ana@x.com>\r\nSubject: =?x-nope?q?lista?=\r\n\r\nhola\r\n"
+    )
+    inbox.unseen[2] = _mail("bob@x.com", "Lista de libros")
+
+    worker.poll_once(None, scheduler)
+
+    assert inbox.sent == [("bob@x.com", "Biblioteca — Respuesta")]
+    assert set(inbox.unseen) == {1}
+
+
+def test_poll_and_process_share_the_same_filters(db, monkeypatch, scheduler):
+    monkeypatch.setattr(worker, "ALLOWED_SENDERS", {"ana@x.com"})
+    inbox = Inbox(monkeypatch)
+    inbox.unseen[1] = _mail("eve@x.com", "Lista de libros")
+
+    worker.poll_once(None, scheduler)
+
+    assert scheduler.pending_uids() == set()
+    assert inbox.sent == []
+    with pytest.raises(RuntimeError, match="sender no permitido"):
+        worker.process_email(inbox.unseen[1])